@@ -4,19 +4,206 @@ import json
 def main():
     # if `export-slides` (subcommand) is in the first argument,
     # then parse and get `--input` and `--output` arguments
-    # if `export-slides` is not in the first argument, then run the app normally
+    # if `download` (subcommand) is in the first argument, then download
+    # non-interactively
+    # otherwise, run the app normally
+    import multiprocessing
     import sys
 
+    # Slide analysis may run in worker processes of a frozen executable
+    multiprocessing.freeze_support()
+
     if len(sys.argv) > 1 and sys.argv[1] == "export-slides":
+        from njupt_smartclass_downloader.slides_extractor.analysis_cache import (
+            default_cache_path,
+        )
         from njupt_smartclass_downloader.slides_extractor.extractor import (
             extract_slides,
         )
-        from argparse import ArgumentParser
+        from njupt_smartclass_downloader.slides_extractor.mode_frame import (
+            STABLE_CHANGE_FRACTION,
+            STABLE_FRAMES,
+        )
+        from njupt_smartclass_downloader.slides_extractor.single_pass import (
+            MAX_SAMPLE_BYTES,
+        )
+        from njupt_smartclass_downloader.slides_extractor.pdf_compositor import (
+            ImageFormat,
+            PdfEncoding,
+        )
+        from njupt_smartclass_downloader.slides_extractor.significant_frame import (
+            ANALYSIS_SCALE,
+        )
+        from argparse import ArgumentParser, ArgumentTypeError
+        from dataclasses import asdict
+        import os
+
+        def scale(text: str) -> float:
+            value = float(text)
+            if not 0 < value <= 1:
+                raise ArgumentTypeError(f"scale must be in (0, 1], got {text}")
+            return value
 
         parser = ArgumentParser(description="Export slides from VGA video")
-        parser.add_argument("--input", required=True)
-        parser.add_argument("--output", required=True)
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument("--input")
+        target.add_argument(
+            "--batch",
+            nargs="?",
+            const="",
+            metavar="ROOT",
+            help="Export the slides of every VGA.mp4 below ROOT (default: the "
+            "download folder) next to it, skipping videos with newer slides",
+        )
+        parser.add_argument("--output")
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Videos exported at a time in batch mode",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Export again even if the slides are up to date, in batch mode",
+        )
+        parser.add_argument(
+            "--analysis-scale",
+            type=scale,
+            default=ANALYSIS_SCALE,
+            help="Scale of the images frames are compared on before full resolution",
+        )
+        parser.add_argument(
+            "--sample-interval",
+            type=int,
+            default=1,
+            help="Analyze only every k-th frame and bisect to find exact changes",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help="Maximum number of processes analyzing chunks of the video",
+        )
+        parser.add_argument(
+            "--mode-samples",
+            type=int,
+            help="Composite each slide from at most this many frames spread "
+            "across it (default: every frame). Without --sample-interval or "
+            "--processes, they are held in memory while the slide is shown, "
+            f"at most {MAX_SAMPLE_BYTES // 2**20} MiB of them",
+        )
+        parser.add_argument(
+            "--mode-stable-fraction",
+            type=float,
+            default=STABLE_CHANGE_FRACTION,
+            help="With --mode-samples, stop compositing a slide once "
+            f"{STABLE_FRAMES} samples in a row changed at most this fraction "
+            "of its pixels (negative to use every sample)",
+        )
+        parser.add_argument(
+            "--dedup",
+            action="store_true",
+            help="Merge slides shown more than once into their first occurrence, "
+            "without compositing them again",
+        )
+        parser.add_argument(
+            "--hash-index",
+            help="Write perceptual hashes and segments of the slides to this file "
+            "(in batch mode, Slides.hashes.json is written next to every PDF)",
+        )
+        parser.add_argument(
+            "--image-format",
+            type=ImageFormat,
+            choices=list(ImageFormat),
+            default=ImageFormat.FLATE,
+            help="Encoding of slide images in the PDF",
+        )
+        parser.add_argument("--jpeg-quality", type=int, default=85)
+        parser.add_argument(
+            "--palette-colors",
+            type=int,
+            default=64,
+            help="Colors of palette-quantized slides",
+        )
+        parser.add_argument(
+            "--max-dpi",
+            type=float,
+            help="Downscale slide images to this resolution at 72 points per inch",
+        )
+        parser.add_argument(
+            "--encode-workers",
+            type=int,
+            default=1,
+            help="Threads encoding slide images",
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.02,
+            help="Fraction of the picture that must change to start a new slide",
+        )
+        parser.add_argument(
+            "--min-time-gap",
+            type=float,
+            default=3,
+            help="Seconds a slide must be shown to be exported",
+        )
+        parser.add_argument(
+            "--analysis-cache",
+            action="store_true",
+            help="Keep the analysis next to the input, so that running again "
+            "with another threshold or time gap is cheap (analyzes every frame)",
+        )
         args = parser.parse_args(sys.argv[2:])
+        if args.input is not None and args.output is None:
+            parser.error("--output is required with --input")
+        mode_stable_fraction = (
+            args.mode_stable_fraction if args.mode_stable_fraction >= 0 else None
+        )
+        pdf_encoding = PdfEncoding(
+            image_format=args.image_format,
+            jpeg_quality=args.jpeg_quality,
+            palette_colors=args.palette_colors,
+            max_dpi=args.max_dpi,
+            workers=args.encode_workers,
+        )
+
+        if args.batch is not None:
+            from njupt_smartclass_downloader.app_task import DOWNLOAD_ROOT
+            from njupt_smartclass_downloader.batch_export import (
+                export_slides_batch,
+                find_videos,
+                is_up_to_date,
+            )
+
+            def report(record: dict) -> None:
+                print(json.dumps(record), flush=True)
+
+            videos = []
+            for video in find_videos(args.batch or DOWNLOAD_ROOT):
+                if not args.force and is_up_to_date(video):
+                    report({"input": video, "status": "skipped"})
+                else:
+                    videos.append(video)
+            _, n_failed = export_slides_batch(
+                videos,
+                {
+                    "threshold": args.threshold,
+                    "min_time_gap": args.min_time_gap,
+                    "analysis_scale": args.analysis_scale,
+                    "sample_interval": args.sample_interval,
+                    "processes": args.processes,
+                    "mode_samples": args.mode_samples,
+                    "mode_stable_fraction": mode_stable_fraction,
+                    "deduplicate": args.dedup,
+                    "pdf_encoding": asdict(pdf_encoding),
+                },
+                max(1, args.jobs),
+                report,
+                analysis_cache=args.analysis_cache,
+            )
+            sys.exit(1 if n_failed else 0)
 
         def progress_callback(step: str, current: int, total: int):
             print(
@@ -24,12 +211,203 @@ def main():
                 flush=True,
             )
 
-        extract_slides(args.input, args.output, report_progress=progress_callback)
+        extract_slides(
+            args.input,
+            args.output,
+            threshold=args.threshold,
+            min_time_gap=args.min_time_gap,
+            report_progress=progress_callback,
+            analysis_scale=args.analysis_scale,
+            sample_interval=args.sample_interval,
+            processes=args.processes,
+            mode_samples=args.mode_samples,
+            mode_stable_fraction=mode_stable_fraction,
+            deduplicate=args.dedup,
+            hash_index_output=args.hash_index,
+            pdf_encoding=pdf_encoding,
+            analysis_cache=(
+                default_cache_path(args.input) if args.analysis_cache else None
+            ),
+        )
         return
 
+    from njupt_smartclass_downloader.app_task import (
+        BandwidthRule,
+        BandwidthScheduler,
+        parse_rate,
+    )
+    from njupt_smartclass_downloader.pool_autoscaler import WorkerLimits
+    from argparse import ArgumentParser
+
+    def add_task_manager_arguments(parser: ArgumentParser) -> None:
+        parser.add_argument(
+            "--asyncio",
+            action="store_true",
+            help="Run index and download tasks on a single asyncio event loop",
+        )
+        parser.add_argument(
+            "--bandwidth-limit",
+            type=parse_rate,
+            help="Total download rate limit in bytes per second, e.g. 2M "
+            "(0 for unlimited)",
+        )
+        parser.add_argument(
+            "--bandwidth-schedule",
+            type=BandwidthRule.parse,
+            action="append",
+            default=[],
+            help="Time-of-day limit such as 08:00-22:00=1M, may be repeated",
+        )
+        parser.add_argument(
+            "--workers",
+            type=WorkerLimits.parse,
+            action="append",
+            default=[],
+            help="Worker count bounds of a pool (index, download or "
+            "extract-slides) such as download=2:16, may be repeated",
+        )
+
+    if len(sys.argv) > 1 and sys.argv[1] == "download":
+        from njupt_smartclass_downloader.app_task import DownloadOptions, FsyncPolicy
+        from njupt_smartclass_downloader.headless_download import (
+            PROGRESS_INTERVAL,
+            download,
+        )
+        from datetime import date
+        import getpass
+        import os
+
+        parser = ArgumentParser(
+            description="Download videos matching a search without the interface, "
+            "printing progress as JSON lines"
+        )
+        parser.add_argument(
+            "--username",
+            default=os.environ.get("NJUPT_USERNAME"),
+            help="SSO username (default: $NJUPT_USERNAME)",
+        )
+        parser.add_argument(
+            "--password-file",
+            help="Read the SSO password from the first line of this file "
+            "(default: $NJUPT_PASSWORD, else prompt)",
+        )
+        parser.add_argument("--title", default="", help="Part of the video title")
+        parser.add_argument(
+            "--course",
+            action="append",
+            default=[],
+            help="Part of the course name, case-insensitive, may be repeated",
+        )
+        parser.add_argument(
+            "--since",
+            type=date.fromisoformat,
+            help="First day of the videos, as YYYY-MM-DD",
+        )
+        parser.add_argument(
+            "--until",
+            type=date.fromisoformat,
+            help="Last day of the videos, as YYYY-MM-DD",
+        )
+        parser.add_argument(
+            "--type",
+            action="append",
+            choices=DownloadOptions().type_filter,
+            help="Stream to download, may be repeated (default: all)",
+        )
+        parser.add_argument(
+            "--no-slides", action="store_true", help="Do not extract slides"
+        )
+        parser.add_argument(
+            "--connections",
+            type=int,
+            default=DownloadOptions().download_connections,
+            help="Connections per download",
+        )
+        parser.add_argument(
+            "--bandwidth-weight",
+            type=float,
+            default=DownloadOptions().bandwidth_weight,
+            help="Relative share of the bandwidth limit while competing with "
+            "other downloads, e.g. resumed ones",
+        )
+        parser.add_argument(
+            "--fsync",
+            type=FsyncPolicy,
+            choices=list(FsyncPolicy),
+            default=FsyncPolicy.NONE,
+        )
+        parser.add_argument(
+            "--progress-interval",
+            type=float,
+            default=PROGRESS_INTERVAL,
+            help="Seconds between progress reports",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only print the matching videos",
+        )
+        add_task_manager_arguments(parser)
+        args = parser.parse_args(sys.argv[2:])
+        if not args.username:
+            parser.error("--username or $NJUPT_USERNAME is required")
+        if args.bandwidth_weight <= 0:
+            parser.error("--bandwidth-weight must be positive")
+        if args.password_file is not None:
+            with open(args.password_file, encoding="utf-8") as f:
+                password = f.readline().rstrip("\r\n")
+        elif "NJUPT_PASSWORD" in os.environ:
+            password = os.environ["NJUPT_PASSWORD"]
+        elif sys.stdin.isatty():
+            password = getpass.getpass()
+        else:
+            parser.error("--password-file or $NJUPT_PASSWORD is required")
+
+        def report(record: dict) -> None:
+            print(json.dumps(record), flush=True)
+
+        options = DownloadOptions(
+            extract_slides=not args.no_slides,
+            download_connections=max(1, args.connections),
+            fsync_policy=args.fsync,
+            bandwidth_weight=args.bandwidth_weight,
+        )
+        if args.type:
+            options.type_filter = args.type
+        try:
+            ok = download(
+                args.username,
+                password,
+                options,
+                report,
+                title=args.title,
+                courses=args.course,
+                since=args.since,
+                until=args.until,
+                dry_run=args.dry_run,
+                use_asyncio=args.asyncio,
+                bandwidth=BandwidthScheduler(
+                    args.bandwidth_limit, args.bandwidth_schedule
+                ),
+                worker_limits=dict(args.workers),
+                interval=args.progress_interval,
+            )
+        except Exception as e:
+            report({"event": "error", "error": str(e)})
+            sys.exit(2)
+        sys.exit(0 if ok else 1)
+
     from njupt_smartclass_downloader.app import NjuptSmartclassDownloaderApp
 
-    app = NjuptSmartclassDownloaderApp()
+    parser = ArgumentParser(description="NJUPT SmartClass Downloader")
+    add_task_manager_arguments(parser)
+    args = parser.parse_args(sys.argv[1:])
+
+    app = NjuptSmartclassDownloaderApp(
+        use_asyncio=args.asyncio,
+        bandwidth=BandwidthScheduler(args.bandwidth_limit, args.bandwidth_schedule),
+        worker_limits=dict(args.workers),
+    )
     app.run()
 
 
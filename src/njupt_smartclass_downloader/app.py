@@ -5,17 +5,31 @@ from textual.app import App
 
 from njupt_smartclass_downloader import app_task
 from njupt_smartclass_downloader.njupt_smartclass import NjuptSmartclass
+from njupt_smartclass_downloader.pool_autoscaler import WorkerLimits
+from njupt_smartclass_downloader.task_journal import TaskJournal
 
 
 class NjuptSmartclassDownloaderApp(App):
     CSS_PATH = "styles/app.tcss"
     TITLE = "NJUPT Smartclass Downloader"
 
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self,
+        *args,
+        use_asyncio: bool = False,
+        bandwidth: Optional[app_task.BandwidthScheduler] = None,
+        worker_limits: Optional[dict[app_task.PoolKind, WorkerLimits]] = None,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
         self.session = requests.Session()
         self.smartclass: Optional[NjuptSmartclass] = None
-        self.task_manager = app_task.TaskManager()
+        self.task_manager = app_task.TaskManager(
+            use_asyncio=use_asyncio,
+            bandwidth=bandwidth,
+            journal=TaskJournal(app_task.TASK_JOURNAL_PATH),
+            worker_limits=worker_limits,
+        )
 
     def on_mount(self) -> None:
         # Avoid circular import issues
@@ -1,27 +1,71 @@
-from dataclasses import dataclass, field
+import asyncio
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field, fields
+import datetime
 from enum import StrEnum
 from io import BytesIO
 import json
 import os
 from pathlib import Path
-from queue import Queue
-import subprocess
-import sys
+from queue import Empty
 import threading
 import time
-from typing import Callable, Generator, List, Optional, Tuple
+from typing import (
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Generator,
+    List,
+    Any,
+    Dict,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+)
 from lxml import etree
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import (
+    DecodeError,
+    ProtocolError,
+    ReadTimeoutError,
+    SSLError as Urllib3SSLError,
+)
 from urllib.parse import urljoin
-
-
-from njupt_smartclass_downloader.njupt_smartclass import NjuptSmartclass
-
-
-class PoolKind(StrEnum):
-    INDEX = "index"
-    DOWNLOAD = "download"
-    EXTRACT_SLIDES = "extract_slides"
+from sanitize_filename import sanitize
+
+
+from njupt_smartclass_downloader.async_http import RETRYABLE_ERRORS, AsyncHttpClient
+from njupt_smartclass_downloader.extraction_pool import (
+    ExtractionAborted,
+    ExtractionWorkerPool,
+)
+from njupt_smartclass_downloader.njupt_smartclass import (
+    NjuptSmartclass,
+    NjuptSmartclassVideoSummary,
+)
+from njupt_smartclass_downloader.pool_autoscaler import (
+    CpuLoadSampler,
+    PoolAutoscaler,
+    PoolKind,
+    PoolSample,
+    WorkerLimits,
+    available_memory_fraction,
+)
+from njupt_smartclass_downloader.task_journal import TaskJournal
+
+T = TypeVar("T")
+
+
+class FsyncPolicy(StrEnum):
+    # Leave write-back entirely to the OS
+    NONE = "none"
+    # fsync once before the .part file is renamed to its final name
+    ON_COMPLETE = "on_complete"
+    # Also fsync before every resume map save, so that the map never claims
+    # bytes that are not on disk yet
+    PERIODIC = "periodic"
 
 
 @dataclass
@@ -30,14 +74,534 @@ class DownloadOptions:
         default_factory=lambda: ["VGA", "Video1", "Video2", "Video3"]
     )
     extract_slides: bool = True
+    # Start extracting slides from the VGA video while it is still downloading
+    extract_slides_while_downloading: bool = True
+    download_connections: int = 4
+    fsync_policy: FsyncPolicy = FsyncPolicy.NONE
+    # Relative share of the bandwidth limit while competing with other downloads
+    bandwidth_weight: float = 1.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "DownloadOptions":
+        known = {f.name for f in fields(DownloadOptions)}
+        options = DownloadOptions(**{k: v for k, v in data.items() if k in known})
+        options.fsync_policy = FsyncPolicy(options.fsync_policy)
+        return options
 
 
+DOWNLOAD_ROOT = os.path.join(".", "SmartclassDownload")
+TASK_JOURNAL_PATH = os.path.join(DOWNLOAD_ROOT, ".tasks.sqlite3")
+
+# Initial number of workers of each pool
 POOL_WORKER_COUNT = {
     PoolKind.INDEX: 2,
     PoolKind.DOWNLOAD: 4,
     PoolKind.EXTRACT_SLIDES: 4,
 }
 
+# Bounds the autoscaler keeps each pool within
+POOL_WORKER_LIMITS = {
+    PoolKind.INDEX: WorkerLimits(1, 8),
+    PoolKind.DOWNLOAD: WorkerLimits(1, 16),
+    PoolKind.EXTRACT_SLIDES: WorkerLimits(1, os.cpu_count() or 1),
+}
+
+# Pools whose tasks are limited by CPU rather than by the network
+CPU_BOUND_POOLS = {PoolKind.EXTRACT_SLIDES}
+
+# Seconds between two autoscaling decisions
+AUTOSCALE_INTERVAL = 5.0
+# Idle workers check this often whether they should retire
+WORKER_IDLE_POLL = 1.0
+
+# Transfers kept in flight by the asyncio engine, all on a single thread
+ASYNC_POOL_CONCURRENCY = {
+    PoolKind.INDEX: 8,
+    PoolKind.DOWNLOAD: 32,
+}
+
+# Ranges smaller than this are not worth an extra connection
+SEGMENT_MIN_SIZE = 4 * 1024 * 1024
+
+# Bounds of the adaptive read size used when streaming a response to disk
+READ_SIZE_MIN = 64 * 1024
+READ_SIZE_MAX = 4 * 1024 * 1024
+# Reads are resized to take about this long, so that slow links still get
+# timely progress reports and stop checks
+READ_TARGET_SECONDS = 0.1
+
+# Minimum interval between two progress reports of a download
+PROGRESS_INTERVAL = 0.5
+# Seconds between checks for an interrupt while an async download backs off
+INTERRUPT_POLL_INTERVAL = 0.5
+# A bandwidth share that drew nothing for this long is left out of the split
+SHARE_IDLE_SECONDS = 1.0
+
+# Keep-alive connections kept per host, enough for every index worker plus
+# every download worker running at the default number of connections
+HTTP_POOL_PER_HOST = (
+    POOL_WORKER_LIMITS[PoolKind.INDEX].maximum
+    + POOL_WORKER_LIMITS[PoolKind.DOWNLOAD].maximum
+    * DownloadOptions().download_connections
+)
+# SmartClass API, SSO and the video CDN
+HTTP_POOL_HOSTS = 4
+
+
+def create_pooled_session(
+    pool_per_host: int = HTTP_POOL_PER_HOST, pool_hosts: int = HTTP_POOL_HOSTS
+) -> requests.Session:
+    """
+    Create a session whose connection pool is shared by every task, so that
+    keep-alive connections survive across tasks and retries.
+    Requests beyond `pool_per_host` concurrent connections to one host block
+    until a connection is returned to the pool.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_hosts, pool_maxsize=pool_per_host, pool_block=True
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@dataclass
+class ByteRange:
+    start: int
+    end: int  # exclusive
+    done: int = 0
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start
+
+    @property
+    def finished(self) -> bool:
+        return self.done >= self.length
+
+
+@dataclass
+class ResumeMap:
+    """
+    Per-range progress of a segmented download, persisted next to the .part file
+    so that every range can be resumed after a crash.
+    """
+
+    path: str
+    total_size: int
+    ranges: List[ByteRange]
+
+    @property
+    def downloaded_bytes(self) -> int:
+        return sum(r.done for r in self.ranges)
+
+    @staticmethod
+    def create(
+        path: str, total_size: int, connections: int, prefix: int = 0
+    ) -> "ResumeMap":
+        """
+        Split the file into `connections` ranges. The first `prefix` bytes are
+        already on disk, e.g. from a single-stream .part file.
+        """
+        ranges = [ByteRange(0, prefix, prefix)] if prefix > 0 else []
+        remaining = total_size - prefix
+        count = max(1, min(connections, remaining // SEGMENT_MIN_SIZE))
+        step = remaining // count
+        for i in range(count):
+            start = prefix + i * step
+            end = total_size if i == count - 1 else start + step
+            ranges.append(ByteRange(start, end))
+        return ResumeMap(path, total_size, ranges)
+
+    @staticmethod
+    def load(path: str) -> Optional["ResumeMap"]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return ResumeMap(
+                path,
+                int(data["total_size"]),
+                [ByteRange(*map(int, r)) for r in data["ranges"]],
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self, done: Optional[List[int]] = None) -> None:
+        """
+        Persist the map, optionally with a snapshot of the `done` counters
+        taken earlier (the ranges keep advancing while the map is written).
+        """
+        if done is None:
+            done = [r.done for r in self.ranges]
+        data = {
+            "total_size": self.total_size,
+            "ranges": [[r.start, r.end, d] for r, d in zip(self.ranges, done)],
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+
+def preallocate_file(path: str, size: int) -> None:
+    """
+    Reserve `size` bytes for `path` up front, so that large videos are laid out
+    contiguously on disk instead of growing (and fragmenting) with every write.
+    Falls back to a sparse file where posix_fallocate is unavailable.
+    """
+    with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+        if hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+                return
+            except OSError:
+                # Not supported by the file system
+                pass
+        f.truncate(size)
+
+
+def fsync_file(path: str) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _checkpoint_resume_map(
+    resume_map: ResumeMap, part_path: str, fsync_policy: FsyncPolicy
+) -> None:
+    if fsync_policy == FsyncPolicy.PERIODIC:
+        # Only persist what was written before the fsync
+        done = [r.done for r in resume_map.ranges]
+        fsync_file(part_path)
+        resume_map.save(done)
+    else:
+        resume_map.save()
+
+
+def _finish_part_file(
+    part_path: str, dest_path: str, fsync_policy: FsyncPolicy
+) -> None:
+    if fsync_policy != FsyncPolicy.NONE:
+        fsync_file(part_path)
+    os.rename(part_path, dest_path)
+
+
+class ProgressThrottle:
+    """
+    Forward download progress at most every `interval` seconds, so that the
+    callback (which takes the TaskManager lock) does not run once per read.
+    """
+
+    def __init__(
+        self,
+        callback: Optional[Callable[[int, int], None]],
+        interval: float = PROGRESS_INTERVAL,
+    ) -> None:
+        self.callback = callback
+        self.interval = interval
+        self.last_time = 0.0
+        self.last_bytes = -1
+
+    def __call__(self, downloaded: int, total: int, force: bool = False) -> None:
+        if self.callback is None or total <= 0 or downloaded == self.last_bytes:
+            return
+        now = time.monotonic()
+        if force or now - self.last_time >= self.interval:
+            self.last_time = now
+            self.last_bytes = downloaded
+            self.callback(downloaded, total)
+
+
+def stream_response_to_file(
+    response: requests.Response, f, limit: Optional[int] = None
+) -> Generator[int, None, None]:
+    """
+    Copy the body of a streamed response into `f` through one reusable buffer,
+    yielding the number of bytes written after every read.
+
+    The read size adapts between READ_SIZE_MIN and READ_SIZE_MAX: it grows
+    while reads fill the buffer quickly and shrinks when they stall.
+
+    Args:
+        response: Response opened with `stream=True`
+        f: File object positioned at the write offset, preferably unbuffered
+        limit: Stop after this many bytes
+    """
+    raw = response.raw
+    # Same behaviour as iter_content
+    raw.decode_content = True
+    buffer = memoryview(bytearray(READ_SIZE_MAX))
+    read_size = READ_SIZE_MIN
+
+    while limit is None or limit > 0:
+        wanted = read_size if limit is None else min(read_size, limit)
+        started = time.monotonic()
+        try:
+            n = raw.readinto(buffer[:wanted])
+        except ProtocolError as e:
+            # Translate like iter_content does, so callers only see requests errors
+            raise requests.exceptions.ChunkedEncodingError(e)
+        except DecodeError as e:
+            raise requests.exceptions.ContentDecodingError(e)
+        except ReadTimeoutError as e:
+            raise requests.exceptions.ConnectionError(e)
+        except Urllib3SSLError as e:
+            raise requests.exceptions.SSLError(e)
+        if not n:
+            return
+        chunk = buffer[:n]
+        while chunk:
+            written = f.write(chunk)
+            chunk = chunk[written:]
+        if limit is not None:
+            limit -= n
+        yield n
+
+        # Measured after the consumer is done with the chunk, so that time
+        # spent waiting for bandwidth also shrinks the reads
+        elapsed = time.monotonic() - started
+        if n == wanted and elapsed < READ_TARGET_SECONDS / 2:
+            read_size = min(read_size * 2, READ_SIZE_MAX)
+        elif elapsed > READ_TARGET_SECONDS * 2:
+            read_size = max(read_size // 2, READ_SIZE_MIN)
+
+
+def parse_rate(text: str) -> int:
+    """Parse a rate such as "512K", "2.5M" or "1MB/s" (bytes per second)."""
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3}
+    text = text.strip().upper().removesuffix("/S").removesuffix("B")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+@dataclass
+class BandwidthRule:
+    """Bandwidth limit applied between two times of day, may wrap midnight."""
+
+    start: datetime.time
+    end: datetime.time
+    limit: Optional[int]  # bytes per second, None for unlimited
+
+    def matches(self, now: datetime.time) -> bool:
+        if self.start <= self.end:
+            return self.start <= now < self.end
+        return now >= self.start or now < self.end
+
+    @staticmethod
+    def parse(text: str) -> "BandwidthRule":
+        """Parse a rule such as "08:00-22:00=1M"; "0" or "none" means unlimited."""
+        span, _, rate = text.partition("=")
+        start, _, end = span.partition("-")
+        if not rate or not end:
+            raise ValueError(f"Invalid bandwidth rule: {text}")
+        rate = rate.strip().lower()
+        return BandwidthRule(
+            start=datetime.time.fromisoformat(start.strip()),
+            end=datetime.time.fromisoformat(end.strip()),
+            limit=None if rate in ("0", "none") else parse_rate(rate),
+        )
+
+
+class BandwidthShare:
+    """
+    One download's claim on the BandwidthScheduler. Use as a context manager;
+    the share only counts towards the split while it is open and drawing
+    bandwidth.
+    """
+
+    def __init__(self, scheduler: "BandwidthScheduler", weight: float) -> None:
+        if weight <= 0:
+            raise ValueError("Bandwidth weight must be positive")
+        self.scheduler = scheduler
+        self.weight = weight
+        # Time at which the bytes granted so far will have been "paid for"
+        self.next_time = 0.0
+
+    def is_active(self, now: float) -> bool:
+        """Whether the share drew bandwidth within the last SHARE_IDLE_SECONDS."""
+        return self.next_time > now - SHARE_IDLE_SECONDS
+
+    def __enter__(self) -> "BandwidthShare":
+        self.scheduler._register(self)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.scheduler._unregister(self)
+
+    def consume(self, nbytes: int) -> None:
+        """Account for `nbytes` just received, sleeping if over the limit."""
+        delay = self.scheduler._reserve(self, nbytes)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def consume_async(self, nbytes: int) -> None:
+        delay = self.scheduler._reserve(self, nbytes)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class BandwidthScheduler:
+    """
+    Token bucket shared by every download. The global limit is taken from the
+    first time-of-day rule that matches (or `default_limit`) and split between
+    the active shares in proportion to their weights; a share that stops
+    drawing, e.g. while it backs off before a retry, leaves its part to the
+    others.
+    """
+
+    def __init__(
+        self,
+        default_limit: Optional[int] = None,
+        rules: Optional[List[BandwidthRule]] = None,
+        burst_seconds: float = 0.5,
+    ) -> None:
+        # A limit of 0 means unlimited, like in rules
+        self.default_limit = default_limit or None
+        self.rules = rules or []
+        self.burst_seconds = burst_seconds
+        self.__mutex = threading.Lock()
+        self.__shares: set[BandwidthShare] = set()
+
+    def current_limit(self, now: Optional[datetime.datetime] = None) -> Optional[int]:
+        if not self.rules:
+            return self.default_limit
+        time_of_day = (now or datetime.datetime.now()).time()
+        for rule in self.rules:
+            if rule.matches(time_of_day):
+                return rule.limit
+        return self.default_limit
+
+    def share(self, weight: float = 1.0) -> BandwidthShare:
+        return BandwidthShare(self, weight)
+
+    def _register(self, share: BandwidthShare) -> None:
+        with self.__mutex:
+            self.__shares.add(share)
+
+    def _unregister(self, share: BandwidthShare) -> None:
+        with self.__mutex:
+            self.__shares.discard(share)
+
+    def _reserve(self, share: BandwidthShare, nbytes: int) -> float:
+        """Return how long the caller has to wait before using `nbytes`."""
+        limit = self.current_limit()
+        if limit is None:
+            return 0.0
+        with self.__mutex:
+            now = time.monotonic()
+            total_weight = share.weight + sum(
+                other.weight
+                for other in self.__shares
+                if other is not share and other.is_active(now)
+            )
+            rate = limit * share.weight / total_weight
+            # Idle time is not banked, only the burst allowance is granted
+            start = max(share.next_time, now)
+            share.next_time = start + nbytes / rate
+            return max(0.0, share.next_time - now - self.burst_seconds)
+
+
+def probe_content_length(
+    url: str, session: Optional[requests.Session] = None
+) -> Optional[int]:
+    """
+    Return the total size of the resource if the server honours byte ranges.
+    """
+    http = session or requests
+    response = http.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=30)
+    with response:
+        if response.status_code != 206:
+            return None
+        content_range = response.headers.get("Content-Range", "")
+        total = content_range.split("/")[-1]
+        if not total.isdigit():
+            return None
+        return int(total)
+
+
+async def probe_content_length_async(url: str, http: AsyncHttpClient) -> Optional[int]:
+    async with http.get(url, {"Range": "bytes=0-0"}) as response:
+        if response.status != 206:
+            return None
+        content_range = response.headers.get("content-range", "")
+        total = content_range.split("/")[-1]
+        if not total.isdigit():
+            return None
+        return int(total)
+
+
+def _load_resume_map(part_path: str, map_path: str) -> Optional[ResumeMap]:
+    # A resume map always wins over the .part size: a segmented .part file is
+    # preallocated, so its size says nothing about how much has been fetched.
+    resume_map = ResumeMap.load(map_path) if os.path.exists(part_path) else None
+    if resume_map is None and os.path.exists(map_path):
+        # Without a readable map the preallocated .part cannot be trusted either
+        os.remove(map_path)
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    return resume_map
+
+
+def _prepare_resume_map(
+    resume_map: Optional[ResumeMap],
+    part_path: str,
+    map_path: str,
+    total_size: int,
+    connections: int,
+) -> ResumeMap:
+    if resume_map is not None and resume_map.total_size != total_size:
+        # Remote file changed, start over
+        os.remove(part_path)
+        os.remove(map_path)
+        resume_map = None
+    if resume_map is None:
+        # A .part without a map was written by the single-stream fallback,
+        # its bytes form a valid prefix
+        prefix = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if prefix >= total_size:
+            os.remove(part_path)
+            prefix = 0
+        resume_map = ResumeMap.create(map_path, total_size, connections, prefix)
+
+        # Save the map first, a preallocated .part without a map would be
+        # mistaken for a nearly complete single-stream download
+        resume_map.save()
+        preallocate_file(part_path, total_size)
+    return resume_map
+
+
+class DownloadInterrupted(Exception):
+    """Raised by a download whose `interrupt` event was set while backing off."""
+
+
+def _backoff(timeout: float, interrupt: Optional[threading.Event]) -> None:
+    """Wait before a retry, cut short by `interrupt`."""
+    if interrupt is None:
+        time.sleep(timeout)
+    elif interrupt.wait(timeout):
+        raise DownloadInterrupted()
+
+
+async def _backoff_async(timeout: float, interrupt: Optional[threading.Event]) -> None:
+    """Wait before a retry on the event loop, cut short by `interrupt`."""
+    if interrupt is None:
+        await asyncio.sleep(timeout)
+        return
+    deadline = time.monotonic() + timeout
+    while not interrupt.is_set():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        await asyncio.sleep(min(remaining, INTERRUPT_POLL_INTERVAL))
+    raise DownloadInterrupted()
+
 
 def download_file_with_retry(
     url: str,
@@ -46,10 +610,19 @@ def download_file_with_retry(
     max_retries: int = 10,
     initial_timeout: float = 1.0,
     max_timeout: float = 300.0,
+    connections: int = 1,
+    session: Optional[requests.Session] = None,
+    fsync_policy: FsyncPolicy = FsyncPolicy.NONE,
+    bandwidth: Optional[BandwidthShare] = None,
+    interrupt: Optional[threading.Event] = None,
 ) -> None:
     """
     Download a file with retry and resume support using exponential backoff.
 
+    If the server supports byte ranges, the .part file is preallocated to the
+    final size and written at offsets, with progress kept in a resume map.
+    Otherwise the file is streamed and appended in a single request.
+
     Args:
         url: URL to download from
         dest_path: Destination file path (will use .part suffix during download)
@@ -57,8 +630,52 @@ def download_file_with_retry(
         max_retries: Maximum number of retry attempts
         initial_timeout: Initial timeout in seconds for exponential backoff
         max_timeout: Maximum timeout in seconds
+        connections: Number of parallel connections; values above 1 split the
+            file into byte ranges if the server supports them
+        session: Optional session to borrow pooled connections from
+        fsync_policy: When to force the downloaded data to disk
+        bandwidth: Optional share of a BandwidthScheduler to draw from
+        interrupt: Optional event which, once set, ends the wait before a
+            retry with DownloadInterrupted
     """
+    http = session or requests
     part_path = dest_path + ".part"
+    map_path = part_path + ".json"
+    report_progress = ProgressThrottle(progress_callback)
+    throttle = bandwidth.consume if bandwidth else None
+
+    resume_map = _load_resume_map(part_path, map_path)
+    total_size = _retry_call(
+        lambda: probe_content_length(url, session),
+        max_retries,
+        initial_timeout,
+        max_timeout,
+        interrupt,
+    )
+    if total_size:
+        resume_map = _prepare_resume_map(
+            resume_map, part_path, map_path, total_size, connections
+        )
+        _download_segmented(
+            http,
+            url,
+            part_path,
+            resume_map,
+            progress_callback,
+            max_retries,
+            initial_timeout,
+            max_timeout,
+            fsync_policy,
+            throttle,
+        )
+        _finish_part_file(part_path, dest_path, fsync_policy)
+        os.remove(map_path)
+        return
+    if resume_map is not None:
+        # Server no longer supports ranges, the segments are useless
+        os.remove(part_path)
+        os.remove(map_path)
+
     retry_count = 0
     timeout = initial_timeout
 
@@ -74,13 +691,13 @@ def download_file_with_retry(
             if start_byte > 0:
                 headers["Range"] = f"bytes={start_byte}-"
 
-            response = requests.get(url, headers=headers, stream=True, timeout=30)
+            response = http.get(url, headers=headers, stream=True, timeout=30)
 
             # Handle response codes
             if response.status_code == 416:
                 # Range not satisfiable - file already complete
                 if os.path.exists(part_path):
-                    os.rename(part_path, dest_path)
+                    _finish_part_file(part_path, dest_path, fsync_policy)
                 return
             elif response.status_code not in (200, 206):
                 response.raise_for_status()
@@ -108,25 +725,22 @@ def download_file_with_retry(
             mode = "ab" if start_byte > 0 and response.status_code == 206 else "wb"
             downloaded_bytes = start_byte
 
-            with open(part_path, mode) as f:
-                chunk_size = 8192
-                for chunk in response.iter_content(chunk_size=chunk_size):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded_bytes += len(chunk)
+            with response, open(part_path, mode, buffering=0) as f:
+                for n in stream_response_to_file(response, f):
+                    downloaded_bytes += n
+                    if throttle:
+                        throttle(n)
 
-                        # Check if we've made progress since last retry
-                        if len(chunk) > 0:
-                            # Reset timeout on progress
-                            timeout = initial_timeout
-                            retry_count = 0
+                    # Reset timeout on progress
+                    timeout = initial_timeout
+                    retry_count = 0
 
-                        # Report progress
-                        if progress_callback and total_size > 0:
-                            progress_callback(downloaded_bytes, total_size)
+                    # Report progress
+                    report_progress(downloaded_bytes, total_size)
+            report_progress(downloaded_bytes, total_size, force=True)
 
             # Download completed successfully
-            os.rename(part_path, dest_path)
+            _finish_part_file(part_path, dest_path, fsync_policy)
             return
 
         except (requests.RequestException, IOError, OSError) as e:
@@ -137,7 +751,334 @@ def download_file_with_retry(
                 raise RuntimeError(f"Download failed after {max_retries} retries: {e}")
             else:
                 # Wait before retrying
-                time.sleep(timeout)
+                _backoff(timeout, interrupt)
+                timeout = min(timeout * 2, max_timeout)
+
+
+def _retry_call(
+    fn: Callable[[], T],
+    max_retries: int,
+    initial_timeout: float,
+    max_timeout: float,
+    interrupt: Optional[threading.Event] = None,
+) -> T:
+    retry_count = 0
+    timeout = initial_timeout
+    while True:
+        try:
+            return fn()
+        except (requests.RequestException, IOError, OSError) as e:
+            retry_count += 1
+            if retry_count > max_retries:
+                raise RuntimeError(f"Download failed after {max_retries} retries: {e}")
+            _backoff(timeout, interrupt)
+            timeout = min(timeout * 2, max_timeout)
+
+
+def _download_segmented(
+    http,
+    url: str,
+    part_path: str,
+    resume_map: ResumeMap,
+    progress_callback: Optional[Callable[[int, int], None]],
+    max_retries: int,
+    initial_timeout: float,
+    max_timeout: float,
+    fsync_policy: FsyncPolicy,
+    throttle: Optional[Callable[[int], None]],
+) -> None:
+    pending = [r for r in resume_map.ranges if not r.finished]
+    if not pending:
+        return
+    stop_event = threading.Event()
+    executor = ThreadPoolExecutor(
+        max_workers=len(pending), thread_name_prefix="SegmentDownloader"
+    )
+    with executor:
+        futures = [
+            executor.submit(
+                _download_range,
+                http,
+                url,
+                part_path,
+                byte_range,
+                stop_event,
+                max_retries,
+                initial_timeout,
+                max_timeout,
+                throttle,
+            )
+            for byte_range in pending
+        ]
+        try:
+            while True:
+                done, not_done = wait(futures, timeout=1.0, return_when=FIRST_EXCEPTION)
+                _checkpoint_resume_map(resume_map, part_path, fsync_policy)
+                if progress_callback:
+                    progress_callback(
+                        resume_map.downloaded_bytes, resume_map.total_size
+                    )
+                if not not_done or any(f.exception() for f in done):
+                    break
+        finally:
+            # Let the other ranges bail out early if one of them failed, or if
+            # the progress callback raised to interrupt the download
+            stop_event.set()
+            executor.shutdown(wait=True)
+            _checkpoint_resume_map(resume_map, part_path, fsync_policy)
+    for future in futures:
+        future.result()
+
+
+def _download_range(
+    http,
+    url: str,
+    part_path: str,
+    byte_range: ByteRange,
+    stop_event: threading.Event,
+    max_retries: int,
+    initial_timeout: float,
+    max_timeout: float,
+    throttle: Optional[Callable[[int], None]],
+) -> None:
+    retry_count = 0
+    timeout = initial_timeout
+
+    while not byte_range.finished:
+        try:
+            offset = byte_range.start + byte_range.done
+            headers = {"Range": f"bytes={offset}-{byte_range.end - 1}"}
+            response = http.get(url, headers=headers, stream=True, timeout=30)
+            with response:
+                if response.status_code != 206:
+                    response.raise_for_status()
+                    raise RuntimeError(
+                        f"Server ignored range request (HTTP {response.status_code})"
+                    )
+
+                with open(part_path, "r+b", buffering=0) as f:
+                    f.seek(offset)
+                    remaining = byte_range.length - byte_range.done
+                    for n in stream_response_to_file(response, f, remaining):
+                        byte_range.done += n
+                        if throttle:
+                            throttle(n)
+
+                        # Reset timeout on progress
+                        timeout = initial_timeout
+                        retry_count = 0
+                        if stop_event.is_set():
+                            return
+
+            if not byte_range.finished:
+                raise IOError("Connection closed before the range was complete")
+
+        except (requests.RequestException, IOError, OSError) as e:
+            retry_count += 1
+
+            if retry_count > max_retries:
+                raise RuntimeError(f"Download failed after {max_retries} retries: {e}")
+            elif stop_event.wait(timeout):
+                return
+            else:
+                timeout = min(timeout * 2, max_timeout)
+
+
+async def download_file_async(
+    url: str,
+    dest_path: str,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    max_retries: int = 10,
+    initial_timeout: float = 1.0,
+    max_timeout: float = 300.0,
+    connections: int = 1,
+    session: Optional[requests.Session] = None,
+    fsync_policy: FsyncPolicy = FsyncPolicy.NONE,
+    bandwidth: Optional[BandwidthShare] = None,
+    interrupt: Optional[threading.Event] = None,
+    http: Optional[AsyncHttpClient] = None,
+) -> None:
+    """
+    Asynchronous counterpart of `download_file_with_retry` used by the asyncio
+    engine. Every range is fetched by a coroutine on the running event loop,
+    over the connections of `http` (a client of its own if not given);
+    servers without range support are handed to the blocking implementation
+    on a worker thread, with `session`.
+    """
+    if http is None:
+        http = AsyncHttpClient(session)
+        try:
+            return await download_file_async(
+                url,
+                dest_path,
+                progress_callback,
+                max_retries,
+                initial_timeout,
+                max_timeout,
+                connections,
+                session,
+                fsync_policy,
+                bandwidth,
+                interrupt,
+                http,
+            )
+        finally:
+            await http.close()
+
+    part_path = dest_path + ".part"
+    map_path = part_path + ".json"
+
+    # Disk work (preallocation, fsync, resume map writes) runs on worker
+    # threads, it would stall every transfer on the loop
+    resume_map = await asyncio.to_thread(_load_resume_map, part_path, map_path)
+    total_size = await _retry_call_async(
+        lambda: probe_content_length_async(url, http),
+        max_retries,
+        initial_timeout,
+        max_timeout,
+        interrupt,
+    )
+    if not total_size:
+        if resume_map is not None:
+            await asyncio.to_thread(os.remove, part_path)
+            await asyncio.to_thread(os.remove, map_path)
+        await asyncio.to_thread(
+            download_file_with_retry,
+            url,
+            dest_path,
+            progress_callback,
+            max_retries,
+            initial_timeout,
+            max_timeout,
+            connections=connections,
+            session=session,
+            fsync_policy=fsync_policy,
+            bandwidth=bandwidth,
+            interrupt=interrupt,
+        )
+        return
+
+    resume_map = await asyncio.to_thread(
+        _prepare_resume_map, resume_map, part_path, map_path, total_size, connections
+    )
+    tasks = [
+        asyncio.create_task(
+            _download_range_async(
+                http,
+                url,
+                part_path,
+                byte_range,
+                max_retries,
+                initial_timeout,
+                max_timeout,
+                bandwidth.consume_async if bandwidth else None,
+            )
+        )
+        for byte_range in resume_map.ranges
+        if not byte_range.finished
+    ]
+    try:
+        while tasks:
+            done, not_done = await asyncio.wait(
+                tasks, timeout=1.0, return_when=asyncio.FIRST_EXCEPTION
+            )
+            await asyncio.to_thread(
+                _checkpoint_resume_map, resume_map, part_path, fsync_policy
+            )
+            if progress_callback:
+                progress_callback(resume_map.downloaded_bytes, resume_map.total_size)
+            if not not_done or any(t.exception() for t in done):
+                break
+    finally:
+        # Let the other ranges bail out early if one of them failed
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.to_thread(
+            _checkpoint_resume_map, resume_map, part_path, fsync_policy
+        )
+    for t in tasks:
+        t.result()
+
+    await asyncio.to_thread(_finish_part_file, part_path, dest_path, fsync_policy)
+    await asyncio.to_thread(os.remove, map_path)
+
+
+async def _retry_call_async(
+    fn: Callable[[], Awaitable[T]],
+    max_retries: int,
+    initial_timeout: float,
+    max_timeout: float,
+    interrupt: Optional[threading.Event] = None,
+) -> T:
+    retry_count = 0
+    timeout = initial_timeout
+    while True:
+        try:
+            return await fn()
+        except RETRYABLE_ERRORS as e:
+            retry_count += 1
+            if retry_count > max_retries:
+                raise RuntimeError(f"Download failed after {max_retries} retries: {e}")
+            await _backoff_async(timeout, interrupt)
+            timeout = min(timeout * 2, max_timeout)
+
+
+async def _download_range_async(
+    http: AsyncHttpClient,
+    url: str,
+    part_path: str,
+    byte_range: ByteRange,
+    max_retries: int,
+    initial_timeout: float,
+    max_timeout: float,
+    throttle: Optional[Callable[[int], Awaitable[None]]],
+) -> None:
+    retry_count = 0
+    timeout = initial_timeout
+
+    while not byte_range.finished:
+        try:
+            offset = byte_range.start + byte_range.done
+            headers = {"Range": f"bytes={offset}-{byte_range.end - 1}"}
+            async with http.get(url, headers) as response:
+                if response.status != 206:
+                    response.raise_for_status()
+                    raise RuntimeError(
+                        f"Server ignored range request (HTTP {response.status})"
+                    )
+
+                # Writes land in the page cache, cheap enough to do on the loop.
+                # Unbuffered, so that bytes counted as done are visible to
+                # readers of the .part file, see DownloadingFileReader
+                with open(part_path, "r+b", buffering=0) as f:
+                    f.seek(offset)
+                    while not byte_range.finished:
+                        remaining = byte_range.length - byte_range.done
+                        chunk = await response.content.read(min(65536, remaining))
+                        if not chunk:
+                            break
+                        view = memoryview(chunk)
+                        while view:
+                            view = view[f.write(view) :]
+                        byte_range.done += len(chunk)
+                        if throttle:
+                            await throttle(len(chunk))
+
+                        # Reset timeout on progress
+                        timeout = initial_timeout
+                        retry_count = 0
+
+            if not byte_range.finished:
+                raise IOError("Connection closed before the range was complete")
+
+        except RETRYABLE_ERRORS as e:
+            retry_count += 1
+
+            if retry_count > max_retries:
+                raise RuntimeError(f"Download failed after {max_retries} retries: {e}")
+            else:
+                await asyncio.sleep(timeout)
                 timeout = min(timeout * 2, max_timeout)
 
 
@@ -146,17 +1087,86 @@ class TaskReporter:
         self.task_manager = task_manager
         self.task_id = task_id
 
+    @property
+    def session(self) -> requests.Session:
+        return self.task_manager.session
+
+    @property
+    def async_http(self) -> AsyncHttpClient:
+        return self.task_manager.async_http
+
+    @property
+    def smartclass(self) -> NjuptSmartclass:
+        return self.task_manager.smartclass
+
+    @property
+    def bandwidth(self) -> BandwidthScheduler:
+        return self.task_manager.bandwidth
+
+    @property
+    def extraction_pool(self) -> ExtractionWorkerPool:
+        return self.task_manager.extraction_pool
+
     def report_progress(
         self, step_name: Optional[str] = None, step_progress: Optional[float] = None
     ) -> None:
         self.task_manager.report_progress(self.task_id, step_name, step_progress)
 
+    def report_transfer(self, bytes_done: int, bytes_total: int) -> None:
+        self.task_manager.report_transfer(self.task_id, bytes_done, bytes_total)
+
+    def checkpoint(self) -> None:
+        """
+        Raise TaskInterrupted if the task was paused or cancelled. Tasks call
+        this regularly at points where they can stop without losing work.
+        """
+        self.task_manager.checkpoint(self.task_id)
+
+    def on_interrupt(self, callback: Callable[[], None]) -> None:
+        """
+        Register a callback invoked (from another thread) when the task is
+        paused or cancelled, to unblock work that cannot reach a checkpoint.
+        """
+        self.task_manager.on_interrupt(self.task_id, callback)
+
 
 class Task:
     def pool_kind(self) -> PoolKind: ...
     def display(self) -> str: ...
     def run(self, reporter: TaskReporter) -> Generator["Task", None, None]: ...
 
+    def key(self) -> str:
+        """Identity of the work, used to drop duplicate submissions."""
+        ...
+
+    def to_params(self) -> Dict[str, Any]:
+        """JSON-serializable constructor arguments, for the task journal."""
+        ...
+
+    @classmethod
+    def from_params(cls, params: Dict[str, Any]) -> "Task":
+        return cls(**params)
+
+    def share_group(self) -> str:
+        """Group (course) whose tasks share workers fairly with other groups."""
+        return ""
+
+    def expected_size(self) -> Optional[int]:
+        """Bytes of work if known in advance, smaller jobs are scheduled first."""
+        return None
+
+    async def run_async(self, reporter: TaskReporter) -> AsyncGenerator["Task", None]:
+        """
+        Run the task on the asyncio engine. By default the blocking `run`
+        generator is stepped on a worker thread.
+        """
+        generator = self.run(reporter)
+        while True:
+            new_task = await asyncio.to_thread(next, generator, None)
+            if new_task is None:
+                break
+            yield new_task
+
 
 class IndexTask(Task):
     def __init__(
@@ -164,35 +1174,83 @@ class IndexTask(Task):
         title: str,
         video_id: str,
         local_path: str,
-        cookies,
         options: DownloadOptions,
+        course: Optional[str] = None,
     ) -> None:
         super().__init__()
         self.title = title
         self.video_id = video_id
         self.local_path = local_path
-        self.cookies = cookies
         self.options = options
+        self.course = course
 
     def pool_kind(self) -> PoolKind:
         return PoolKind.INDEX
 
+    def share_group(self) -> str:
+        return self.course or self.title
+
     def display(self) -> str:
         return f"{self.title} - Index"
 
+    def key(self) -> str:
+        return f"index:{self.local_path}"
+
+    def to_params(self) -> Dict[str, Any]:
+        return {
+            "title": self.title,
+            "video_id": self.video_id,
+            "local_path": self.local_path,
+            "options": self.options.to_dict(),
+            "course": self.course,
+        }
+
+    @classmethod
+    def from_params(cls, params: Dict[str, Any]) -> "IndexTask":
+        return cls(
+            **{**params, "options": DownloadOptions.from_dict(params["options"])}
+        )
+
+    @classmethod
+    def for_video(
+        cls, video: NjuptSmartclassVideoSummary, options: DownloadOptions
+    ) -> "IndexTask":
+        """Index a search result into its folder below DOWNLOAD_ROOT."""
+        if video.start_time.date() != video.stop_time.date():
+            sanitized_time_str = (
+                video.start_time.strftime("%Y%m%d%H%M")
+                + "_"
+                + video.stop_time.strftime("%Y%m%d%H%M")
+            )
+        else:
+            sanitized_time_str = (
+                video.start_time.strftime("%Y%m%d %H%M")
+                + "_"
+                + video.stop_time.strftime("%H%M")
+            )
+        local_path = os.path.join(
+            DOWNLOAD_ROOT,
+            sanitize(video.course_name),
+            sanitized_time_str,
+        )
+        return cls(
+            title=f"{video.course_name} - {sanitized_time_str}",
+            video_id=video.id,
+            local_path=local_path,
+            options=options,
+            course=video.course_name,
+        )
+
     def run(self, reporter: TaskReporter) -> Generator[Task, None, None]:
-        session = requests.Session()
-        session.cookies.update(self.cookies)
-        smartclass = NjuptSmartclass(session)
-        video_info = smartclass.get_video_info_by_id(self.video_id)
+        session = reporter.session
+        video_info = reporter.smartclass.get_video_info_by_id(self.video_id)
         if video_info is None:
             raise ValueError(f"Video info not found for ID: {self.video_id}")
         if len(video_info.segments) == 0:
             raise ValueError(f"No segments found for video ID: {self.video_id}")
         single_segment = len(video_info.segments) == 1
         for segment_index, segment in enumerate(video_info.segments):
-            index_xml = session.get(segment.index_file_uri).content
-
+            reporter.checkpoint()
             segment_path = (
                 os.path.join(self.local_path, f"Seg{segment_index + 1}")
                 if not single_segment
@@ -200,11 +1258,18 @@ class IndexTask(Task):
             )
             os.makedirs(segment_path, exist_ok=True)
 
-            # save index.xml
             metadata_path = os.path.join(segment_path, "index.xml")
-            os.makedirs(os.path.dirname(metadata_path), exist_ok=True)
-            with open(metadata_path, "wb") as f:
-                f.write(index_xml)
+            if os.path.exists(metadata_path):
+                # Saved by an earlier (possibly interrupted) run
+                with open(metadata_path, "rb") as f:
+                    index_xml = f.read()
+            else:
+                index_xml = session.get(segment.index_file_uri).content
+
+                # save index.xml, atomically so that a saved file is complete
+                with open(metadata_path + ".part", "wb") as f:
+                    f.write(index_xml)
+                os.replace(metadata_path + ".part", metadata_path)
 
             # extract video sources from index.xml
             index_tree = etree.parse(BytesIO(index_xml), parser=etree.XMLParser())
@@ -240,8 +1305,22 @@ class IndexTask(Task):
                     remote_url=remote_url,
                     local_path=local_path,
                     options=self.options,
+                    course=self.course,
+                    expected_size=self.__probe_size(session, remote_url, local_path),
                 )
 
+    @staticmethod
+    def __probe_size(
+        session: requests.Session, remote_url: str, local_path: str
+    ) -> Optional[int]:
+        if os.path.exists(local_path):
+            return 0
+        try:
+            return probe_content_length(remote_url, session)
+        except requests.RequestException:
+            # Only used for scheduling, the download will retry on its own
+            return None
+
 
 class DownloadTask(Task):
     def __init__(
@@ -252,6 +1331,8 @@ class DownloadTask(Task):
         remote_url: str,
         local_path: str,
         options: DownloadOptions,
+        course: Optional[str] = None,
+        expected_size: Optional[int] = None,
     ) -> None:
         super().__init__()
         self.title = title
@@ -260,52 +1341,202 @@ class DownloadTask(Task):
         self.remote_url = remote_url
         self.local_path = local_path
         self.options = options
+        self.course = course
+        self.size = expected_size
 
     def pool_kind(self) -> PoolKind:
         return PoolKind.DOWNLOAD
 
+    def share_group(self) -> str:
+        return self.course or self.title
+
+    def expected_size(self) -> Optional[int]:
+        return self.size
+
     def display(self) -> str:
         if self.segment_seq is not None:
             return f"{self.title} - Seg{self.segment_seq} - {self.video_type})"
         return f"{self.title} - {self.video_type}"
 
+    def key(self) -> str:
+        return f"download:{self.local_path}"
+
+    def to_params(self) -> Dict[str, Any]:
+        return {
+            "title": self.title,
+            "video_type": self.video_type,
+            "segment_seq": self.segment_seq,
+            "remote_url": self.remote_url,
+            "local_path": self.local_path,
+            "options": self.options.to_dict(),
+            "course": self.course,
+            "expected_size": self.size,
+        }
+
+    @classmethod
+    def from_params(cls, params: Dict[str, Any]) -> "DownloadTask":
+        return cls(
+            **{**params, "options": DownloadOptions.from_dict(params["options"])}
+        )
+
     def run(self, reporter: TaskReporter) -> Generator[Task, None, None]:
         os.makedirs(os.path.dirname(self.local_path), exist_ok=True)
 
         if not os.path.exists(self.local_path):
+            # Ends the tasks started early as soon as the download stops
+            stopped = threading.Event()
+            yield from self.follow_up_tasks(downloading=True, stopped=stopped)
 
             def progress_callback(downloaded: int, total: int) -> None:
-                progress = downloaded / total if total > 0 else 0
-                reporter.report_progress(step_progress=progress)
+                reporter.report_transfer(downloaded, total)
+                # Stops the transfer, the .part file is kept for resuming
+                reporter.checkpoint()
 
-            download_file_with_retry(
-                self.remote_url, self.local_path, progress_callback=progress_callback
-            )
+            # Ends a backoff between retries, which makes no progress
+            interrupted = threading.Event()
+            reporter.on_interrupt(interrupted.set)
+            try:
+                with reporter.bandwidth.share(self.options.bandwidth_weight) as share:
+                    try:
+                        download_file_with_retry(
+                            self.remote_url,
+                            self.local_path,
+                            progress_callback=progress_callback,
+                            connections=self.options.download_connections,
+                            session=reporter.session,
+                            fsync_policy=self.options.fsync_policy,
+                            bandwidth=share,
+                            interrupt=interrupted,
+                        )
+                    except DownloadInterrupted:
+                        reporter.checkpoint()
+                        raise
+            except Exception:
+                stopped.set()
+                raise
+
+        yield from self.follow_up_tasks()
+
+    async def run_async(self, reporter: TaskReporter) -> AsyncGenerator[Task, None]:
+        os.makedirs(os.path.dirname(self.local_path), exist_ok=True)
+
+        if not os.path.exists(self.local_path):
+            stopped = threading.Event()
+            for task in self.follow_up_tasks(downloading=True, stopped=stopped):
+                yield task
+
+            def progress_callback(downloaded: int, total: int) -> None:
+                reporter.report_transfer(downloaded, total)
+                # Stops the transfer, the .part file is kept for resuming
+                reporter.checkpoint()
 
+            interrupted = threading.Event()
+            reporter.on_interrupt(interrupted.set)
+            try:
+                with reporter.bandwidth.share(self.options.bandwidth_weight) as share:
+                    try:
+                        await download_file_async(
+                            self.remote_url,
+                            self.local_path,
+                            progress_callback=progress_callback,
+                            connections=self.options.download_connections,
+                            session=reporter.session,
+                            fsync_policy=self.options.fsync_policy,
+                            bandwidth=share,
+                            interrupt=interrupted,
+                            http=reporter.async_http,
+                        )
+                    except DownloadInterrupted:
+                        reporter.checkpoint()
+                        raise
+            except Exception:
+                stopped.set()
+                raise
+
+        for task in self.follow_up_tasks():
+            yield task
+
+    def follow_up_tasks(
+        self, downloading: bool = False, stopped: Optional[threading.Event] = None
+    ) -> Generator[Task, None, None]:
+        """
+        Args:
+            downloading: Yield only the tasks which can start before the video
+                is complete. Yielded again once it is, they are dropped as
+                duplicates unless they failed or were cancelled meanwhile.
+            stopped: With `downloading`, set once the download is paused,
+                cancelled or fails
+        """
+        if downloading and not self.options.extract_slides_while_downloading:
+            return
         if self.video_type == "VGA" and self.options.extract_slides:
             # If it's VGA video, extract slides
             yield ExtractSlidesTask(
                 title=self.title,
                 video_path=self.local_path,
                 segment_seq=self.segment_seq,
+                course=self.course,
+                wait_for_download=downloading,
+                download_stopped=stopped,
             )
 
 
 class ExtractSlidesTask(Task):
-    def __init__(self, title: str, video_path: str, segment_seq: Optional[int]) -> None:
+    def __init__(
+        self,
+        title: str,
+        video_path: str,
+        segment_seq: Optional[int],
+        course: Optional[str] = None,
+        wait_for_download: bool = False,
+        download_stopped: Optional[threading.Event] = None,
+    ) -> None:
+        """
+        Args:
+            wait_for_download: The video is still being downloaded, analyze it
+                as it arrives instead of failing on the missing file
+            download_stopped: Set when that download stops unfinished, which
+                cancels this task at once rather than leaving it waiting for
+                data until the download is given up on as stalled. The
+                download yields it again when resumed.
+        """
         super().__init__()
         self.title = title
         self.video_path = video_path
         self.segment_seq = segment_seq
+        self.course = course
+        self.wait_for_download = wait_for_download
+        self.download_stopped = download_stopped
 
     def pool_kind(self) -> PoolKind:
         return PoolKind.EXTRACT_SLIDES
 
+    def share_group(self) -> str:
+        return self.course or self.title
+
+    def expected_size(self) -> Optional[int]:
+        # Analysis time grows with the length of the video
+        if os.path.exists(self.video_path):
+            return os.path.getsize(self.video_path)
+        return None
+
     def display(self) -> str:
         if self.segment_seq is not None:
             return f"{self.title} - Seg{self.segment_seq} - Slides"
         return f"{self.title} - Slides"
 
+    def key(self) -> str:
+        return f"slides:{self.video_path}"
+
+    def to_params(self) -> Dict[str, Any]:
+        return {
+            "title": self.title,
+            "video_path": self.video_path,
+            "segment_seq": self.segment_seq,
+            "course": self.course,
+            "wait_for_download": self.wait_for_download,
+        }
+
     def run(self, reporter: TaskReporter) -> Generator[Task, None, None]:
         slides_file = os.path.realpath(
             os.path.join(os.path.dirname(self.video_path), "Slides.pdf")
@@ -316,52 +1547,39 @@ class ExtractSlidesTask(Task):
         if os.path.exists(slides_file_part):
             os.remove(slides_file_part)
 
-        process = None
+        job = {
+            "video_input": os.path.realpath(self.video_path),
+            "pdf_output": slides_file_part,
+            "hash_index_output": os.path.join(
+                os.path.dirname(slides_file), "Slides.hashes.json"
+            ),
+            "pdf_encoding": {"image_format": "auto"},
+        }
+        download_stopped = None
+        if self.wait_for_download and not os.path.exists(self.video_path):
+            job["wait_for_download"] = True
+            download_stopped = self.download_stopped
         try:
-            args = []
-            if getattr(sys, "frozen", False):
-                args.append(sys.executable)
-            else:
-                args.append(sys.executable)
-                args.append(os.path.dirname(os.path.realpath(__file__)))
-            args.extend(
-                [
-                    "export-slides",
-                    "--input",
-                    os.path.realpath(self.video_path),
-                    "--output",
-                    slides_file_part,
-                ]
-            )
-            process = subprocess.Popen(
-                args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+            return_code = reporter.extraction_pool.run(
+                job,
+                lambda step, current, total: reporter.report_progress(
+                    step_name=step,
+                    step_progress=current / total if total > 0 else None,
+                ),
+                reporter.on_interrupt,
+                download_stopped,
             )
-            assert process.stdout is not None, "subprocess stdout is None"
-
-            while True:
-                line = process.stdout.readline()
-                if not line:
-                    break
-                try:
-                    json_data = json.loads(line)
-                    reporter.report_progress(
-                        step_name=json_data.get("step"),
-                        step_progress=(
-                            json_data.get("current") / json_data.get("total")
-                            if json_data.get("total") > 0
-                            else None
-                        ),
-                    )
-                except json.JSONDecodeError as e:
-                    continue
-            return_code = process.wait()
-            if return_code != 0:
-                raise RuntimeError(f"Script failed with return code {return_code}.")
-        except Exception as e:
+        except ExtractionAborted:
+            raise TaskInterrupted(TaskStatus.CANCELLED)
+        except Exception:
+            # A worker terminated by pause or cancel fails with this error
+            reporter.checkpoint()
             raise
-        finally:
-            if process and process.poll() is None:
-                process.terminate()
+        reporter.checkpoint()
+        if return_code != 0:
+            raise RuntimeError(
+                f"Slide extraction failed with return code {return_code}."
+            )
 
         os.rename(slides_file_part, slides_file)
         yield from ()
@@ -372,6 +1590,22 @@ class TaskStatus(StrEnum):
     RUNNING = "running"
     COMPLETED = "completed"
     FAILED = "failed"
+    PAUSED = "paused"
+    CANCELLED = "cancelled"
+
+
+class TaskInterrupted(Exception):
+    """Raised at a checkpoint of a task that was paused or cancelled."""
+
+    def __init__(self, status: TaskStatus) -> None:
+        super().__init__(f"Task {status}")
+        self.status = status
+
+
+# Task classes that can be restored from the journal
+TASK_TYPES: Dict[str, Type[Task]] = {
+    cls.__name__: cls for cls in (IndexTask, DownloadTask, ExtractSlidesTask)
+}
 
 
 @dataclass
@@ -384,6 +1618,12 @@ class TaskInnerState:
     step_progress: Optional[float] = None
     start_time: Optional[float] = None
     end_time: Optional[float] = None
+    journal_id: Optional[int] = None
+    priority: int = 0
+    bytes_done: Optional[int] = None
+    # PAUSED or CANCELLED once requested for a running task
+    stop_request: Optional[TaskStatus] = None
+    interrupt_callbacks: List[Callable[[], None]] = field(default_factory=list)
 
 
 @dataclass
@@ -395,61 +1635,507 @@ class TaskInfo:
     step_name: Optional[str] = None
     step_progress: Optional[float] = None
     elapsed_time: float = 0
+    priority: int = 0
 
 
-class TaskManager:
+@dataclass
+class _QueueEntry:
+    task_id: str
+    priority: int
+    group: str
+    size: Optional[int]
+    seq: int
+
+
+class TaskQueue:
+    """
+    Thread-safe queue of task ids for one pool. Entries are taken by, in order:
+    higher priority, fewer running tasks of the same group (fair share between
+    courses), smaller expected size (shortest job first) and submission order.
+
+    Pools hold at most a few thousand entries, so `get` scans them instead of
+    keeping a heap whose keys would go stale as running counts change.
+    """
+
     def __init__(self) -> None:
+        self.__cond = threading.Condition()
+        self.__entries: dict[str, _QueueEntry] = {}
+        self.__running: dict[str, _QueueEntry] = {}
+        self.__group_running: dict[str, int] = {}
+        self.__seq = 0
+
+    def put(
+        self,
+        task_id: str,
+        priority: int = 0,
+        group: str = "",
+        size: Optional[int] = None,
+    ) -> None:
+        with self.__cond:
+            self.__seq += 1
+            self.__entries[task_id] = _QueueEntry(
+                task_id, priority, group, size, self.__seq
+            )
+            self.__cond.notify()
+
+    def set_priority(self, task_id: str, priority: int) -> None:
+        with self.__cond:
+            if task_id in self.__entries:
+                self.__entries[task_id].priority = priority
+
+    def get(self, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Take the next task id, or return None if none arrives within `timeout`.
+        """
+        with self.__cond:
+            if not self.__cond.wait_for(lambda: self.__entries, timeout):
+                return None
+            return self.__take()
+
+    def get_nowait(self) -> str:
+        with self.__cond:
+            if not self.__entries:
+                raise Empty
+            return self.__take()
+
+    def remove(self, task_id: str) -> bool:
+        """Drop a queued entry, returns False if it is not queued."""
+        with self.__cond:
+            return self.__entries.pop(task_id, None) is not None
+
+    def pending(self) -> int:
+        with self.__cond:
+            return len(self.__entries)
+
+    def running(self) -> int:
+        with self.__cond:
+            return len(self.__running)
+
+    def task_done(self, task_id: str) -> None:
+        with self.__cond:
+            entry = self.__running.pop(task_id)
+            self.__group_running[entry.group] -= 1
+            if self.__group_running[entry.group] == 0:
+                del self.__group_running[entry.group]
+
+    def __take(self) -> str:
+        entry = min(
+            self.__entries.values(),
+            key=lambda e: (
+                -e.priority,
+                self.__group_running.get(e.group, 0),
+                e.size if e.size is not None else float("inf"),
+                e.seq,
+            ),
+        )
+        del self.__entries[entry.task_id]
+        self.__running[entry.task_id] = entry
+        self.__group_running[entry.group] = self.__group_running.get(entry.group, 0) + 1
+        return entry.task_id
+
+
+class TaskManager:
+    def __init__(
+        self,
+        use_asyncio: bool = False,
+        bandwidth: Optional[BandwidthScheduler] = None,
+        journal: Optional[TaskJournal] = None,
+        worker_limits: Optional[dict[PoolKind, WorkerLimits]] = None,
+        download_connections: int = DownloadOptions().download_connections,
+    ) -> None:
+        """
+        Args:
+            use_asyncio: Run the pools listed in ASYNC_POOL_CONCURRENCY on a
+                single event loop thread instead of one thread per worker
+            bandwidth: Scheduler all downloads draw from, unlimited if omitted
+            journal: Journal recording submitted tasks, see `resume_from_journal`
+            worker_limits: Overrides of POOL_WORKER_LIMITS, the worker count of
+                each threaded pool is scaled within these bounds
+            download_connections: Connections of the downloads that will be
+                submitted, the connection pool holds that many for every
+                download worker
+        """
         self.__info_mutex = threading.Lock()
         self.__tasks: dict[str, TaskInnerState] = {}
+        self.__journal = journal
+        # Bytes received by all downloads, sampled by the autoscaler
+        self.__bytes_transferred = 0
+
+        limits = {**POOL_WORKER_LIMITS, **(worker_limits or {})}
+        async_pools = ASYNC_POOL_CONCURRENCY if use_asyncio else {}
+        # Tasks of each network pool that can run at once
+        concurrency = {
+            kind: async_pools.get(kind, limits[kind].maximum)
+            for kind in (PoolKind.INDEX, PoolKind.DOWNLOAD)
+        }
+
+        # Connection pool shared by all tasks
+        pool_per_host = (
+            concurrency[PoolKind.INDEX]
+            + concurrency[PoolKind.DOWNLOAD] * download_connections
+        )
+        self.session = create_pooled_session(pool_per_host=pool_per_host)
+        # Its counterpart for the asyncio engine, sending the same cookies
+        self.async_http = AsyncHttpClient(
+            self.session,
+            limit_per_host=pool_per_host,
+            limit=pool_per_host * HTTP_POOL_HOSTS,
+        )
+        self.smartclass = NjuptSmartclass(self.session)
+        self.bandwidth = bandwidth or BandwidthScheduler()
+        # Slide extraction runs in worker processes that outlive single tasks
+        self.extraction_pool = ExtractionWorkerPool(
+            max_idle=limits[PoolKind.EXTRACT_SLIDES].clamp(
+                POOL_WORKER_COUNT[PoolKind.EXTRACT_SLIDES]
+            )
+        )
 
-        # Using Queue for thread-safe task management
-        self.__pools: dict[PoolKind, Queue[str]] = {kind: Queue() for kind in PoolKind}
+        self.__pools: dict[PoolKind, TaskQueue] = {
+            kind: TaskQueue() for kind in PoolKind
+        }
 
+        self.__scale_mutex = threading.Lock()
+        self.__worker_count: dict[PoolKind, int] = {}
+        self.__worker_target: dict[PoolKind, int] = {}
+        self.__worker_seq = 0
+        self.__autoscalers: dict[PoolKind, PoolAutoscaler] = {}
         for kind, count in POOL_WORKER_COUNT.items():
-            for i in range(count):
+            if kind in async_pools:
+                continue
+            self.__autoscalers[kind] = PoolAutoscaler(
+                limits[kind], cpu_bound=kind in CPU_BOUND_POOLS
+            )
+            self.__worker_count[kind] = 0
+            self.__scale_to(kind, limits[kind].clamp(count))
+        if self.__autoscalers:
+            threading.Thread(
+                target=self.__autoscale, daemon=True, name="TaskAutoscaler"
+            ).start()
+
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__wakeups: dict[PoolKind, asyncio.Event] = {}
+        if async_pools:
+            self.__loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=self.__loop.run_forever,
+                daemon=True,
+                name="TaskWorker-asyncio",
+            ).start()
+            for kind, concurrency in async_pools.items():
+                self.__wakeups[kind] = asyncio.Event()
+                asyncio.run_coroutine_threadsafe(
+                    self.__async_dispatcher(kind, concurrency), self.__loop
+                )
+
+    def __scale_to(self, kind: PoolKind, target: int) -> None:
+        """
+        Start workers up to `target`; surplus workers retire once idle.
+        """
+        if kind == PoolKind.EXTRACT_SLIDES:
+            # Each worker thread runs its jobs in one of these processes
+            self.extraction_pool.resize(target)
+        with self.__scale_mutex:
+            self.__worker_target[kind] = target
+            while self.__worker_count[kind] < target:
+                self.__worker_count[kind] += 1
+                self.__worker_seq += 1
                 threading.Thread(
                     target=self.__worker,
                     args=(kind,),
                     daemon=True,
-                    name=f"TaskWorker-{kind}-{i}",
+                    name=f"TaskWorker-{kind}-{self.__worker_seq}",
                 ).start()
 
+    def __should_retire(self, kind: PoolKind) -> bool:
+        with self.__scale_mutex:
+            if self.__worker_count[kind] > self.__worker_target[kind]:
+                self.__worker_count[kind] -= 1
+                return True
+            return False
+
+    def __autoscale(self) -> None:
+        cpu = CpuLoadSampler()
+        last_time = time.monotonic()
+        last_bytes = self.__bytes_transferred
+        while True:
+            time.sleep(AUTOSCALE_INTERVAL)
+            now = time.monotonic()
+            transferred = self.__bytes_transferred
+            download_rate = (transferred - last_bytes) / (now - last_time)
+            last_time, last_bytes = now, transferred
+
+            cpu_load = cpu.sample()
+            memory = available_memory_fraction()
+            for kind, autoscaler in self.__autoscalers.items():
+                pool = self.__pools[kind]
+                with self.__scale_mutex:
+                    workers = self.__worker_target[kind]
+                sample = PoolSample(
+                    workers=workers,
+                    busy=pool.running(),
+                    backlog=pool.pending(),
+                )
+                if kind == PoolKind.DOWNLOAD:
+                    sample.throughput = download_rate
+                    sample.throughput_cap = self.bandwidth.current_limit()
+                target = autoscaler.decide(sample, cpu_load, memory)
+                if target != workers:
+                    self.__scale_to(kind, target)
+
+    def worker_counts(self) -> dict[PoolKind, int]:
+        """Current target worker count of each threaded pool."""
+        with self.__scale_mutex:
+            return dict(self.__worker_target)
+
     def __worker(self, kind: PoolKind) -> None:
         pool = self.__pools[kind]
-        while True:
-            task_id = pool.get()
+        while not self.__should_retire(kind):
+            task_id = pool.get(timeout=WORKER_IDLE_POLL)
             if task_id is None:
-                break
-            with self.__info_mutex:
-                inner_state = self.__tasks[task_id]
-                inner_state.status = TaskStatus.RUNNING
-                inner_state.start_time = time.monotonic()
-                task = inner_state.task
-                del inner_state
+                continue
+            task = self.__start_task(task_id)
             try:
                 for new_task in task.run(TaskReporter(self, task_id)):
-                    self.submit_task(new_task)
-                with self.__info_mutex:
-                    inner_state = self.__tasks[task_id]
-                    inner_state.status = TaskStatus.COMPLETED
-                    inner_state.end_time = time.monotonic()
+                    self.submit_task(new_task, priority=self.__priority_of(task_id))
+                self.__finish_task(task_id)
             except Exception as e:
-                with self.__info_mutex:
-                    inner_state = self.__tasks[task_id]
-                    inner_state.status = TaskStatus.FAILED
-                    inner_state.end_time = time.monotonic()
-                    inner_state.error = str(e)
+                self.__finish_task(task_id, e)
             finally:
-                pool.task_done()
+                pool.task_done(task_id)
 
-    def submit_task(self, task: Task) -> None:
-        kind = task.pool_kind()
-        id = f"t{len(self.__tasks) + 1}"
+    async def __async_dispatcher(self, kind: PoolKind, concurrency: int) -> None:
+        pool = self.__pools[kind]
+        wakeup = self.__wakeups[kind]
+        slots = asyncio.Semaphore(concurrency)
+        running: set[asyncio.Task] = set()
+        while True:
+            await slots.acquire()
+            while True:
+                wakeup.clear()
+                try:
+                    task_id = pool.get_nowait()
+                    break
+                except Empty:
+                    await wakeup.wait()
+            runner = asyncio.create_task(self.__run_async(kind, task_id))
+            running.add(runner)
+            runner.add_done_callback(running.discard)
+            runner.add_done_callback(lambda _: slots.release())
+
+    async def __run_async(self, kind: PoolKind, task_id: str) -> None:
+        task = self.__start_task(task_id)
+        try:
+            async for new_task in task.run_async(TaskReporter(self, task_id)):
+                self.submit_task(new_task, priority=self.__priority_of(task_id))
+            self.__finish_task(task_id)
+        except Exception as e:
+            self.__finish_task(task_id, e)
+        finally:
+            self.__pools[kind].task_done(task_id)
+
+    def __start_task(self, task_id: str) -> Task:
+        with self.__info_mutex:
+            inner_state = self.__tasks[task_id]
+            inner_state.status = TaskStatus.RUNNING
+            inner_state.start_time = time.monotonic()
+            journal_id = inner_state.journal_id
+            task = inner_state.task
+        if self.__journal and journal_id is not None:
+            self.__journal.update_status(journal_id, TaskStatus.RUNNING)
+        return task
+
+    def __finish_task(self, task_id: str, error: Optional[Exception] = None) -> None:
         with self.__info_mutex:
+            inner_state = self.__tasks[task_id]
+            inner_state.end_time = time.monotonic()
+            if error is None:
+                inner_state.status = TaskStatus.COMPLETED
+            elif isinstance(error, TaskInterrupted):
+                inner_state.status = error.status
+            else:
+                inner_state.status = TaskStatus.FAILED
+                inner_state.error = str(error)
+            inner_state.stop_request = None
+            inner_state.interrupt_callbacks.clear()
+            journal_id = inner_state.journal_id
+            status = inner_state.status
+        # Follow-up tasks are journaled before their parent is marked done, so
+        # a crash in between at worst re-runs the parent (duplicates are dropped)
+        if self.__journal and journal_id is not None:
+            self.__journal.update_status(journal_id, status, inner_state.error)
+
+    def set_cookies(self, cookies) -> None:
+        """Inject the cookies of the login session into the shared session."""
+        self.session.cookies.clear()
+        self.session.cookies.update(cookies)
+
+    def submit_task(
+        self,
+        task: Task,
+        journal_id: Optional[int] = None,
+        priority: int = 0,
+        paused: bool = False,
+    ) -> None:
+        """
+        Args:
+            journal_id: Existing journal entry of the task, when resuming it
+            priority: Higher runs earlier, follow-up tasks inherit it
+            paused: Add the task as paused, see `resume_task`
+        """
+        key = task.key()
+        status = TaskStatus.PAUSED if paused else TaskStatus.QUEUED
+        with self.__info_mutex:
+            for state in self.__tasks.values():
+                if state.status in (
+                    TaskStatus.QUEUED,
+                    TaskStatus.RUNNING,
+                    TaskStatus.PAUSED,
+                ) and (state.task.key() == key):
+                    # Same work already pending, e.g. re-yielded by a resumed task
+                    return
+            id = f"t{len(self.__tasks) + 1}"
             self.__tasks[id] = TaskInnerState(
-                id=id, task=task, status=TaskStatus.QUEUED
+                id=id, task=task, status=status, priority=priority
             )
-        self.__pools[kind].put(id)
+        if self.__journal:
+            if journal_id is None:
+                journal_id = self.__journal.add(
+                    type(task).__name__, task.to_params(), status
+                )
+            else:
+                self.__journal.update_status(journal_id, status)
+        with self.__info_mutex:
+            self.__tasks[id].journal_id = journal_id
+        if not paused:
+            self.__enqueue(id)
+
+    def __enqueue(self, task_id: str) -> None:
+        with self.__info_mutex:
+            inner_state = self.__tasks[task_id]
+            task = inner_state.task
+            priority = inner_state.priority
+        kind = task.pool_kind()
+        self.__pools[kind].put(
+            task_id, priority, task.share_group(), task.expected_size()
+        )
+        if kind in self.__wakeups and self.__loop is not None:
+            self.__loop.call_soon_threadsafe(self.__wakeups[kind].set)
+
+    def pause_task(self, task_id: str) -> None:
+        """
+        Pause a queued or running task. Running tasks stop at their next
+        checkpoint and keep their partial output, see `resume_task`.
+        """
+        self.__interrupt(task_id, TaskStatus.PAUSED)
+
+    def cancel_task(self, task_id: str) -> None:
+        """
+        Cancel a queued, running or paused task. Partial downloads are kept on
+        disk, so submitting the same video again picks up where it stopped.
+        """
+        self.__interrupt(task_id, TaskStatus.CANCELLED)
+
+    def resume_task(self, task_id: str) -> None:
+        """Re-queue a paused, cancelled or failed task."""
+        with self.__info_mutex:
+            if task_id not in self.__tasks:
+                return
+            inner_state = self.__tasks[task_id]
+            if inner_state.status not in (
+                TaskStatus.PAUSED,
+                TaskStatus.CANCELLED,
+                TaskStatus.FAILED,
+            ):
+                return
+            inner_state.status = TaskStatus.QUEUED
+            inner_state.error = None
+            inner_state.start_time = None
+            inner_state.end_time = None
+            journal_id = inner_state.journal_id
+        if self.__journal and journal_id is not None:
+            self.__journal.update_status(journal_id, TaskStatus.QUEUED)
+        self.__enqueue(task_id)
+
+    def __interrupt(self, task_id: str, status: TaskStatus) -> None:
+        with self.__info_mutex:
+            if task_id not in self.__tasks:
+                return
+            inner_state = self.__tasks[task_id]
+            kind = inner_state.task.pool_kind()
+            callbacks: List[Callable[[], None]] = []
+            if inner_state.status == TaskStatus.RUNNING:
+                inner_state.stop_request = status
+                callbacks = list(inner_state.interrupt_callbacks)
+            elif inner_state.status == TaskStatus.PAUSED or (
+                inner_state.status == TaskStatus.QUEUED
+                and self.__pools[kind].remove(task_id)
+            ):
+                inner_state.status = status
+                inner_state.end_time = time.monotonic()
+            else:
+                return
+            journal_id = inner_state.journal_id
+            changed = inner_state.status == status
+        if changed and self.__journal and journal_id is not None:
+            self.__journal.update_status(journal_id, status)
+        for callback in callbacks:
+            callback()
+
+    def checkpoint(self, task_id: str) -> None:
+        with self.__info_mutex:
+            stop_request = self.__tasks[task_id].stop_request
+        if stop_request is not None:
+            raise TaskInterrupted(stop_request)
+
+    def on_interrupt(self, task_id: str, callback: Callable[[], None]) -> None:
+        with self.__info_mutex:
+            inner_state = self.__tasks[task_id]
+            inner_state.interrupt_callbacks.append(callback)
+            stop_request = inner_state.stop_request
+        if stop_request is not None:
+            callback()
+
+    def resume_from_journal(self) -> int:
+        """
+        Re-enqueue the tasks a previous session left unfinished.
+        Returns the number of tasks resumed.
+        """
+        if self.__journal is None:
+            return 0
+        count = 0
+        for entry in self.__journal.unfinished():
+            task_type = TASK_TYPES.get(entry.kind)
+            if task_type is None:
+                continue
+            task = task_type.from_params(entry.params)
+            if any(state.journal_id == entry.id for state in self.__snapshot_states()):
+                continue
+            self.submit_task(
+                task, journal_id=entry.id, paused=entry.status == TaskStatus.PAUSED
+            )
+            count += 1
+        return count
+
+    def __priority_of(self, task_id: str) -> int:
+        with self.__info_mutex:
+            return self.__tasks[task_id].priority
+
+    def set_priority(self, task_id: str, priority: int) -> None:
+        """
+        Change the priority of a task. Queued tasks are reordered, tasks it
+        yields from now on inherit the new priority.
+        """
+        with self.__info_mutex:
+            if task_id not in self.__tasks:
+                return
+            inner_state = self.__tasks[task_id]
+            inner_state.priority = priority
+            kind = inner_state.task.pool_kind()
+        self.__pools[kind].set_priority(task_id, priority)
+
+    def __snapshot_states(self) -> list[TaskInnerState]:
+        with self.__info_mutex:
+            return list(self.__tasks.values())
 
     def report_progress(
         self, task_id: str, step_name: Optional[str], step_progress: Optional[float]
@@ -459,6 +2145,20 @@ class TaskManager:
                 self.__tasks[task_id].step_name = step_name
                 self.__tasks[task_id].step_progress = step_progress
 
+    def report_transfer(self, task_id: str, bytes_done: int, bytes_total: int) -> None:
+        with self.__info_mutex:
+            if task_id not in self.__tasks:
+                return
+            inner_state = self.__tasks[task_id]
+            inner_state.step_progress = bytes_done / bytes_total if bytes_total else 0
+            # The first report of a resumed download includes earlier sessions
+            if inner_state.bytes_done is not None:
+                self.__bytes_transferred += max(0, bytes_done - inner_state.bytes_done)
+            inner_state.bytes_done = bytes_done
+            journal_id = inner_state.journal_id
+        if self.__journal and journal_id is not None:
+            self.__journal.update_transfer(journal_id, bytes_done, bytes_total)
+
     def get_task_info(self) -> list[TaskInfo]:
         result = []
         with self.__info_mutex:
@@ -477,6 +2177,7 @@ class TaskManager:
                         step_name=state.step_name,
                         step_progress=state.step_progress,
                         elapsed_time=elapsed_time,
+                        priority=state.priority,
                     )
                 )
         return result
@@ -0,0 +1,71 @@
+import asyncio
+from typing import Dict, Optional
+
+import aiohttp
+import requests
+from requests.cookies import get_cookie_header
+
+# Errors after which a request of the asyncio engine is worth retrying
+RETRYABLE_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, OSError, EOFError)
+
+
+class AsyncHttpClient:
+    """
+    Connection pool of the asyncio engine, the counterpart of the pooled
+    requests session: keep-alive connections are reused across tasks and
+    retries, and requests beyond `limit_per_host` connections to one host
+    wait for a free one.
+
+    Cookies are taken from `cookie_source` on every request, so that the jar
+    of the login session stays the only one and updates to it apply to both
+    engines. The aiohttp session is created on first use, on the event loop
+    it is used from.
+    """
+
+    def __init__(
+        self,
+        cookie_source: Optional[requests.Session] = None,
+        limit_per_host: int = 0,
+        limit: int = 100,
+        timeout: float = 30,
+    ) -> None:
+        self.cookie_source = cookie_source
+        self.limit_per_host = limit_per_host
+        self.limit = limit
+        self.timeout = timeout
+        self.__session: Optional[aiohttp.ClientSession] = None
+
+    def __client(self) -> aiohttp.ClientSession:
+        if self.__session is None or self.__session.closed:
+            self.__session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.limit, limit_per_host=self.limit_per_host
+                ),
+                # Cookies set by responses are not kept, see `cookie_source`
+                cookie_jar=aiohttp.DummyCookieJar(),
+                timeout=aiohttp.ClientTimeout(
+                    sock_connect=self.timeout, sock_read=self.timeout
+                ),
+                headers={"Accept-Encoding": "identity"},
+                auto_decompress=False,
+            )
+        return self.__session
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None):
+        """
+        Issue a GET request, use as `async with client.get(...) as response`.
+        Redirects are followed; the body is left unread.
+        """
+        request_headers = dict(headers or {})
+        if self.cookie_source is not None:
+            cookie = get_cookie_header(
+                self.cookie_source.cookies, requests.Request("GET", url)
+            )
+            if cookie:
+                request_headers["Cookie"] = cookie
+        return self.__client().get(url, headers=request_headers)
+
+    async def close(self) -> None:
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
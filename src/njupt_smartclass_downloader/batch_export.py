@@ -0,0 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+import threading
+from typing import Any, Callable, Dict, List, Tuple
+
+from njupt_smartclass_downloader.extraction_pool import ExtractionWorkerPool
+from njupt_smartclass_downloader.slides_extractor.analysis_cache import (
+    default_cache_path,
+)
+
+VIDEO_NAME = "VGA.mp4"
+SLIDES_NAME = "Slides.pdf"
+HASH_INDEX_NAME = "Slides.hashes.json"
+
+
+def is_up_to_date(video_path: str) -> bool:
+    """Whether the slides next to the video were written after the video."""
+    slides_path = os.path.join(os.path.dirname(video_path), SLIDES_NAME)
+    try:
+        return os.path.getmtime(slides_path) >= os.path.getmtime(video_path)
+    except OSError:
+        return False
+
+
+def find_videos(root: str) -> List[str]:
+    """Complete VGA videos below `root`, in a stable order."""
+    videos = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        if VIDEO_NAME in filenames:
+            videos.append(os.path.join(dirpath, VIDEO_NAME))
+    return videos
+
+
+def export_slides_batch(
+    videos: List[str],
+    job_options: Dict[str, Any],
+    jobs: int,
+    report: Callable[[Dict[str, Any]], None],
+    analysis_cache: bool = False,
+) -> Tuple[int, int]:
+    """
+    Export the slides of every video next to it, as the app does, with up to
+    `jobs` videos at a time in long-lived worker processes.
+
+    Args:
+        job_options: Arguments of `extract_slides` shared by all videos, see
+            `ExtractionWorkerPool.run`
+        report: Called with progress and status records of the videos, from
+            several threads but never concurrently
+        analysis_cache: Keep the analysis of every video next to it
+
+    Returns:
+        Numbers of videos done and failed
+    """
+    # Jobs with `processes` analyze a video in processes of their own
+    pool = ExtractionWorkerPool(max_idle=jobs, daemon=False)
+    report_mutex = threading.Lock()
+    interrupt_callbacks: List[Callable[[], None]] = []
+
+    def locked_report(record: Dict[str, Any]) -> None:
+        with report_mutex:
+            report(record)
+
+    def on_interrupt(callback: Callable[[], None]) -> None:
+        with report_mutex:
+            interrupt_callbacks.append(callback)
+
+    def export(video_path: str) -> None:
+        directory = os.path.dirname(video_path)
+        slides_file = os.path.join(directory, SLIDES_NAME)
+        slides_file_part = slides_file + ".part"
+        job = {
+            **job_options,
+            "video_input": os.path.realpath(video_path),
+            "pdf_output": slides_file_part,
+            "hash_index_output": os.path.join(directory, HASH_INDEX_NAME),
+        }
+        if analysis_cache:
+            job["analysis_cache"] = default_cache_path(job["video_input"])
+        return_code = pool.run(
+            job,
+            lambda step, current, total: locked_report(
+                {"input": video_path, "step": step, "current": current, "total": total}
+            ),
+            on_interrupt,
+        )
+        if return_code != 0:
+            raise RuntimeError(
+                f"Slide extraction failed with return code {return_code}."
+            )
+        # Replaces slides exported before
+        os.replace(slides_file_part, slides_file)
+
+    n_done = 0
+    n_failed = 0
+    executor = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="BatchExport")
+    try:
+        futures = {executor.submit(export, video): video for video in videos}
+        for future in as_completed(futures):
+            video = futures[future]
+            error = future.exception()
+            if error is None:
+                n_done += 1
+                locked_report({"input": video, "status": "done"})
+            else:
+                n_failed += 1
+                locked_report({"input": video, "status": "failed", "error": str(error)})
+    except KeyboardInterrupt:
+        executor.shutdown(wait=False, cancel_futures=True)
+        with report_mutex:
+            callbacks = list(interrupt_callbacks)
+        for callback in callbacks:
+            callback()
+        raise
+    finally:
+        executor.shutdown(wait=True)
+        pool.shutdown()
+    return n_done, n_failed
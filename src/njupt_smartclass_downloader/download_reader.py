@@ -0,0 +1,171 @@
+import io
+import os
+import time
+from typing import List, Optional, Tuple
+
+from njupt_smartclass_downloader.app_task import ResumeMap
+
+# Seconds between two looks at a download which has nothing new to read
+DOWNLOAD_POLL_INTERVAL = 0.5
+# A download which made no progress for this long is given up on
+DOWNLOAD_STALL_TIMEOUT = 600.0
+# Bytes read from disk at once, so that the .part file is opened rarely
+READ_AHEAD_SIZE = 1024 * 1024
+
+
+class DownloadingFileReader(io.BufferedIOBase):
+    """
+    Read a file while `download_file_with_retry` is still writing it, e.g. to
+    decode a video with `cv2.VideoCapture(reader, cv2.CAP_FFMPEG, [])`.
+
+    Which bytes are on disk is derived like the downloader does on resume:
+    from the resume map of a segmented download, or from the size of a
+    single-stream .part file. Reads of bytes not downloaded yet block until
+    they arrive, and seeking relative to the end blocks until the size is
+    known. Once the download finishes, the final file is read instead.
+
+    The .part file is only held open while reading from it, so that it can
+    still be renamed on Windows.
+
+    An exception raised into OpenCV crashes the process, so errors such as a
+    stalled download end the stream instead and are kept in `error`, which
+    should be checked after decoding.
+    """
+
+    def __init__(self, dest_path: str) -> None:
+        super().__init__()
+        self.dest_path = dest_path
+        self.part_path = dest_path + ".part"
+        self.map_path = self.part_path + ".json"
+        self.error: Optional[Exception] = None
+        self.__pos = 0
+        self.__buffer = b""
+        self.__buffer_start = 0
+
+    def __repr__(self) -> str:
+        return f"DownloadingFileReader({self.dest_path!r})"
+
+    def __available(self) -> Tuple[str, List[Tuple[int, int]], Optional[int]]:
+        """
+        Returns:
+            File to read from, byte intervals on disk in [start, end) form and
+            the total size if known
+        """
+        if os.path.exists(self.dest_path):
+            size = os.path.getsize(self.dest_path)
+            return self.dest_path, [(0, size)], size
+        if os.path.exists(self.map_path):
+            resume_map = ResumeMap.load(self.map_path)
+            if resume_map is None:
+                return self.part_path, [], None
+            if all(r.finished for r in resume_map.ranges):
+                # About to be renamed, wait for the final file instead
+                return self.part_path, [], resume_map.total_size
+            intervals = [(r.start, r.start + r.done) for r in resume_map.ranges]
+            return self.part_path, intervals, resume_map.total_size
+        if os.path.exists(self.part_path):
+            return self.part_path, [(0, os.path.getsize(self.part_path))], None
+        return self.part_path, [], None
+
+    def __wait_for(self, pos: Optional[int]) -> Tuple[str, int, Optional[int]]:
+        """
+        Wait until the byte at `pos` is on disk, the end of the file is reached
+        or, without `pos`, the total size is known.
+
+        Returns:
+            File to read from, end of the interval containing `pos` (`pos`
+            itself at the end of the file) and the total size if known
+        """
+        last_progress = None
+        deadline = time.monotonic() + DOWNLOAD_STALL_TIMEOUT
+        while True:
+            path, intervals, total_size = self.__available()
+            if pos is None:
+                if total_size is not None:
+                    return path, total_size, total_size
+            elif total_size is not None and pos >= total_size:
+                return path, pos, total_size
+            else:
+                for start, end in intervals:
+                    if start <= pos < end:
+                        return path, end, total_size
+
+            progress = sum(end - start for start, end in intervals)
+            if progress != last_progress:
+                last_progress = progress
+                deadline = time.monotonic() + DOWNLOAD_STALL_TIMEOUT
+            elif time.monotonic() > deadline:
+                raise TimeoutError(
+                    f"Download of {self.dest_path} stalled for "
+                    f"{DOWNLOAD_STALL_TIMEOUT:.0f} seconds"
+                )
+            time.sleep(DOWNLOAD_POLL_INTERVAL)
+
+    def __fill(self, pos: int) -> None:
+        while True:
+            path, end, _ = self.__wait_for(pos)
+            if end <= pos:
+                self.__buffer, self.__buffer_start = b"", pos
+                return
+            try:
+                with open(path, "rb") as f:
+                    f.seek(pos)
+                    self.__buffer = f.read(min(READ_AHEAD_SIZE, end - pos))
+                    self.__buffer_start = pos
+                    return
+            except FileNotFoundError:
+                # Renamed in the meantime
+                continue
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.__pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if self.error is not None:
+            return self.__pos
+        try:
+            if whence == io.SEEK_SET:
+                pos = offset
+            elif whence == io.SEEK_CUR:
+                pos = self.__pos + offset
+            elif whence == io.SEEK_END:
+                _, total_size, _ = self.__wait_for(None)
+                pos = total_size + offset
+            else:
+                raise ValueError(f"Invalid whence {whence}")
+            if pos < 0:
+                raise ValueError(f"Negative seek position {pos}")
+        except Exception as e:
+            self.error = e
+            return self.__pos
+        self.__pos = pos
+        return pos
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        if size is None or size < 0:
+            chunks = []
+            while chunk := self.read(READ_AHEAD_SIZE):
+                chunks.append(chunk)
+            return b"".join(chunks)
+        if size == 0 or self.error is not None:
+            return b""
+        offset = self.__pos - self.__buffer_start
+        if not 0 <= offset < len(self.__buffer):
+            try:
+                self.__fill(self.__pos)
+            except Exception as e:
+                self.error = e
+                return b""
+            offset = 0
+        data = self.__buffer[offset : offset + size]
+        self.__pos += len(data)
+        return data
+
+    def read1(self, size: int = -1) -> bytes:
+        return self.read(size if size >= 0 else READ_AHEAD_SIZE)
@@ -0,0 +1,227 @@
+import multiprocessing
+from multiprocessing.connection import Connection
+import os
+import signal
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+# Seconds between checks whether a busy worker is still alive
+WORKER_POLL_INTERVAL = 0.5
+# Workers are replaced after this many jobs, bounding leaks in native code
+MAX_JOBS_PER_WORKER = 50
+# Seconds a worker is given to exit on shutdown before it is terminated
+WORKER_STOP_TIMEOUT = 5.0
+
+
+class ExtractionAborted(Exception):
+    """Raised by `ExtractionWorkerPool.run` when its `abort` event is set."""
+
+
+def _worker_main(conn: Connection) -> None:
+    # Imported once per process, which is what makes later jobs cheap
+    from njupt_smartclass_downloader.slides_extractor.extractor import extract_slides
+    from njupt_smartclass_downloader.slides_extractor.pdf_compositor import (
+        ImageFormat,
+        PdfEncoding,
+    )
+
+    def report_progress(step: str, current: int, total: int) -> None:
+        conn.send(("progress", step, current, total))
+
+    def terminate(signum: int, frame: Any) -> None:
+        # Processes analyzing chunks of the video would wait for work forever
+        for child in multiprocessing.active_children():
+            child.terminate()
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+    # Terminating a process on Windows runs no handlers, so this is POSIX only
+    signal.signal(signal.SIGTERM, terminate)
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        try:
+            encoding = job.pop("pdf_encoding", None)
+            if encoding is not None:
+                encoding = PdfEncoding(**encoding)
+                encoding.image_format = ImageFormat(encoding.image_format)
+            reader = None
+            if job.pop("wait_for_download", False):
+                # Only needed by the few jobs started before the video is complete
+                from njupt_smartclass_downloader.download_reader import (
+                    DownloadingFileReader,
+                )
+
+                reader = DownloadingFileReader(job["video_input"])
+                job["video_input"] = reader
+            return_code = extract_slides(
+                **job, report_progress=report_progress, pdf_encoding=encoding
+            )
+            # The decoder takes a failed read for the end of the video
+            if reader is not None and reader.error is not None:
+                raise reader.error
+            conn.send(("done", return_code))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+class ExtractionWorker:
+    """A process running extraction jobs it receives over a pipe, one at a time."""
+
+    def __init__(self, context: Any, name: str, daemon: bool) -> None:
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn,), daemon=daemon, name=name
+        )
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def exit_error(self) -> RuntimeError:
+        # The pipe closes slightly before the process can be reaped
+        self.process.join(WORKER_POLL_INTERVAL)
+        return RuntimeError(
+            f"Extraction worker exited with code {self.process.exitcode}"
+        )
+
+    def terminate(self) -> None:
+        self.process.terminate()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.conn.close()
+
+    def join(self) -> None:
+        """Wait for a stopped worker to exit, terminating it if it does not."""
+        self.process.join(WORKER_STOP_TIMEOUT)
+        if self.process.is_alive():
+            self.terminate()
+            self.process.join()
+
+
+class ExtractionWorkerPool:
+    """
+    Long-lived extraction worker processes, so that the interpreter start-up
+    and the imports of cv2, numpy, PIL and reportlab are paid once per worker
+    rather than once per video.
+
+    Workers are started on demand and kept idle afterwards, up to `max_idle`,
+    which follows the size of the pool feeding it jobs, see `resize`.
+    A worker that crashes or is terminated only fails the job it was running
+    and is replaced by a fresh one for the next job.
+
+    Workers are daemonic by default, so that they never outlive the
+    application, but daemonic processes cannot start processes of their own
+    as `extract_slides` does with `processes`. Without `daemon`, `shutdown`
+    must be called before exiting, or the interpreter waits for idle workers.
+    """
+
+    def __init__(self, max_idle: int, daemon: bool = True) -> None:
+        self.max_idle = max_idle
+        self.daemon = daemon
+        # Forking a process with running threads is unsafe
+        self.__context = multiprocessing.get_context("spawn")
+        self.__mutex = threading.Lock()
+        self.__idle: List[ExtractionWorker] = []
+        self.__seq = 0
+
+    def __acquire(self) -> ExtractionWorker:
+        with self.__mutex:
+            while self.__idle:
+                worker = self.__idle.pop()
+                if worker.is_alive():
+                    return worker
+            self.__seq += 1
+            name = f"ExtractionWorker-{self.__seq}"
+        return ExtractionWorker(self.__context, name, self.daemon)
+
+    def __release(self, worker: ExtractionWorker) -> None:
+        with self.__mutex:
+            if (
+                worker.is_alive()
+                and worker.jobs < MAX_JOBS_PER_WORKER
+                and len(self.__idle) < self.max_idle
+            ):
+                self.__idle.append(worker)
+                return
+        worker.stop()
+
+    def resize(self, max_idle: int) -> None:
+        """Keep up to `max_idle` idle workers from now on, stopping the rest."""
+        with self.__mutex:
+            self.max_idle = max_idle
+            surplus = self.__idle[max_idle:]
+            del self.__idle[max_idle:]
+        for worker in surplus:
+            worker.stop()
+
+    def run(
+        self,
+        job: Dict[str, Any],
+        report_progress: Callable[[str, int, int], None],
+        on_interrupt: Callable[[Callable[[], None]], None],
+        abort: Optional[threading.Event] = None,
+    ) -> int:
+        """
+        Run `extract_slides` with the keyword arguments `job` in a worker.
+        `pdf_encoding` is given as a dict of `PdfEncoding` fields. With
+        `wait_for_download`, `video_input` is the destination of a download
+        which is still running, see `DownloadingFileReader`.
+
+        Args:
+            on_interrupt: Registers a callback that aborts the job
+            abort: Terminate the worker and raise ExtractionAborted once set,
+                checked as often as the worker is
+
+        Returns:
+            Return code of `extract_slides`
+        """
+        worker = self.__acquire()
+        on_interrupt(worker.terminate)
+        worker.jobs += 1
+        # A worker left mid-job would hand its stale messages to the next job
+        finished = False
+        try:
+            worker.conn.send(job)
+            while True:
+                if abort is not None and abort.is_set():
+                    raise ExtractionAborted()
+                if not worker.conn.poll(WORKER_POLL_INTERVAL):
+                    if not worker.is_alive():
+                        raise worker.exit_error()
+                    continue
+                message = worker.conn.recv()
+                if message[0] == "progress":
+                    report_progress(*message[1:])
+                elif message[0] == "done":
+                    finished = True
+                    return message[1]
+                else:
+                    finished = True
+                    raise RuntimeError(message[1])
+        except (EOFError, BrokenPipeError, ConnectionResetError) as e:
+            raise worker.exit_error() from e
+        finally:
+            if not finished:
+                worker.terminate()
+                worker.process.join()
+            self.__release(worker)
+
+    def shutdown(self) -> None:
+        with self.__mutex:
+            idle, self.__idle = self.__idle, []
+        for worker in idle:
+            worker.stop()
+        for worker in idle:
+            worker.join()
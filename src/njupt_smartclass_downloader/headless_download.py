@@ -0,0 +1,183 @@
+from datetime import date
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+from njupt_smartclass_downloader.app_task import (
+    TASK_JOURNAL_PATH,
+    BandwidthScheduler,
+    DownloadOptions,
+    IndexTask,
+    PoolKind,
+    TaskInfo,
+    TaskManager,
+    TaskStatus,
+)
+from njupt_smartclass_downloader.njupt_smartclass import (
+    SSO_SERVICE_URL,
+    NjuptSmartclass,
+    NjuptSmartclassVideoSearchCondition,
+    NjuptSmartclassVideoSummary,
+)
+from njupt_smartclass_downloader.njupt_sso import NjuptSso
+from njupt_smartclass_downloader.pool_autoscaler import WorkerLimits
+from njupt_smartclass_downloader.task_journal import TaskJournal
+
+# Seconds between two looks at the tasks by default
+PROGRESS_INTERVAL = 1.0
+
+
+def login(session: requests.Session, username: str, password: str) -> None:
+    """Log in to the SSO and grant the session to Smartclass, as the app does."""
+    sso = NjuptSso(session)
+    session.cookies.clear()
+    sso.login(username, password)
+    sso.grant_service(SSO_SERVICE_URL)
+
+
+def search_videos(
+    smartclass: NjuptSmartclass,
+    title: str = "",
+    courses: Optional[List[str]] = None,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+) -> List[NjuptSmartclassVideoSummary]:
+    """
+    Videos whose title contains `title`, of a course whose name contains one
+    of `courses` (case-insensitive, any course if empty), starting between
+    `since` and `until` inclusive.
+
+    Searches cannot be filtered by course, so courses are matched here. Dates
+    are matched here as well, whatever the search made of them.
+    """
+    condition = NjuptSmartclassVideoSearchCondition(
+        title_key=title,
+        start_date=since.isoformat() if since is not None else "",
+        end_date=until.isoformat() if until is not None else "",
+    )
+    keys = [course.casefold() for course in courses or []]
+    videos = []
+    for video in smartclass.search_video_all(condition):
+        day = video.start_time.date()
+        if since is not None and day < since:
+            continue
+        if until is not None and day > until:
+            continue
+        if keys and not any(key in video.course_name.casefold() for key in keys):
+            continue
+        videos.append(video)
+    return videos
+
+
+def wait_for_tasks(
+    task_manager: TaskManager,
+    report: Callable[[Dict[str, Any]], None],
+    interval: float = PROGRESS_INTERVAL,
+) -> List[TaskInfo]:
+    """
+    Report the tasks whose state changed every `interval` seconds, until no
+    task is queued or running any more. Paused tasks are left behind.
+
+    Returns:
+        Final state of all tasks
+    """
+    last: Dict[str, tuple] = {}
+    while True:
+        infos = task_manager.get_task_info()
+        for info in infos:
+            progress = (
+                round(info.step_progress, 2) if info.step_progress is not None else None
+            )
+            state = (info.status, info.step_name, progress, info.error)
+            if last.get(info.id) == state:
+                continue
+            last[info.id] = state
+            report(
+                {
+                    "event": "task",
+                    "id": info.id,
+                    "task": info.display_name,
+                    "status": info.status.value,
+                    "step": info.step_name,
+                    "progress": progress,
+                    "error": info.error,
+                }
+            )
+        # Follow-up tasks are submitted before the task yielding them finishes
+        if not any(
+            info.status in (TaskStatus.QUEUED, TaskStatus.RUNNING) for info in infos
+        ):
+            return infos
+        time.sleep(interval)
+
+
+def download(
+    username: str,
+    password: str,
+    options: DownloadOptions,
+    report: Callable[[Dict[str, Any]], None],
+    title: str = "",
+    courses: Optional[List[str]] = None,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    dry_run: bool = False,
+    use_asyncio: bool = False,
+    bandwidth: Optional[BandwidthScheduler] = None,
+    worker_limits: Optional[Dict[PoolKind, WorkerLimits]] = None,
+    interval: float = PROGRESS_INTERVAL,
+) -> bool:
+    """
+    Download the videos matching a search like the app does, without any
+    interface, reporting progress as records for scripts.
+
+    Unfinished tasks of earlier sessions are resumed from the journal first,
+    and tasks interrupted here are resumed by the next session.
+
+    Args:
+        report: Called with `video` records of the matched videos, `task`
+            records of changed tasks and a final `summary` record
+        dry_run: Only report the matched videos
+
+    Returns:
+        Whether no task failed
+    """
+    session = requests.Session()
+    login(session, username, password)
+    videos = search_videos(NjuptSmartclass(session), title, courses, since, until)
+    for video in videos:
+        report(
+            {
+                "event": "video",
+                "id": video.id,
+                "title": video.title,
+                "course": video.course_name,
+                "start_time": video.start_time.isoformat(),
+                "stop_time": video.stop_time.isoformat(),
+            }
+        )
+    if dry_run:
+        return True
+
+    task_manager = TaskManager(
+        use_asyncio=use_asyncio,
+        bandwidth=bandwidth,
+        journal=TaskJournal(TASK_JOURNAL_PATH),
+        worker_limits=worker_limits,
+        download_connections=options.download_connections,
+    )
+    try:
+        task_manager.set_cookies(session.cookies)
+        task_manager.resume_from_journal()
+        for video in videos:
+            # Skipped as a duplicate if a resumed task is still indexing it
+            task_manager.submit_task(IndexTask.for_video(video, options))
+        infos = wait_for_tasks(task_manager, report, interval)
+    finally:
+        task_manager.extraction_pool.shutdown()
+
+    counts = {status.value: 0 for status in TaskStatus}
+    for info in infos:
+        counts[info.status.value] += 1
+    report({"event": "summary", **counts})
+    return counts[TaskStatus.FAILED.value] == 0
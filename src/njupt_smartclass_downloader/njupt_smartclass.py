@@ -3,6 +3,7 @@ import dataclasses
 from datetime import datetime
 from io import BytesIO
 import json
+import threading
 import time
 from typing import Generator
 import pytz
@@ -11,6 +12,8 @@ from Crypto.Cipher import AES
 from Crypto.Util import Padding
 
 TZ_CST = pytz.timezone("Asia/Shanghai")
+# Service the SSO session is granted to before using the Smartclass API
+SSO_SERVICE_URL = "https://njupt.smartclass.cn/SystemSpace/Redirect.aspx"
 
 
 @dataclasses.dataclass
@@ -64,6 +67,8 @@ class NjuptSmartclass:
 
         self.cached_csrk_key = ""
         self.csrk_expiration = time.monotonic()
+        # Tasks share one instance, only one of them refreshes an expired key
+        self.__csrk_mutex = threading.Lock()
 
     def fetch_domain_config(self):
         url = f"{self.base_url}/config.json"
@@ -86,15 +91,16 @@ class NjuptSmartclass:
         return domain_config
 
     def get_csrk_key(self) -> str:
-        if time.monotonic() < self.csrk_expiration:
-            return self.cached_csrk_key
-        domain_config = self.fetch_domain_config()
-        csrk_key = domain_config.get("csrkKey")
-        if not csrk_key:
-            raise ValueError("CSRK key not found in domain config")
-        self.csrk_expiration = time.monotonic() + 1800
-        self.cached_csrk_key = csrk_key
-        return csrk_key
+        with self.__csrk_mutex:
+            if time.monotonic() < self.csrk_expiration:
+                return self.cached_csrk_key
+            domain_config = self.fetch_domain_config()
+            csrk_key = domain_config.get("csrkKey")
+            if not csrk_key:
+                raise ValueError("CSRK key not found in domain config")
+            self.csrk_expiration = time.monotonic() + 1800
+            self.cached_csrk_key = csrk_key
+            return csrk_key
 
     def get_csrk_token(self) -> str:
         csrk_key = self.get_csrk_key()
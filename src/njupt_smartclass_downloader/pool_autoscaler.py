@@ -0,0 +1,183 @@
+from dataclasses import dataclass
+from enum import StrEnum
+import os
+from typing import Optional, Tuple
+
+# Load (busy CPU fraction) above which CPU-bound pools shrink, and below which
+# they may grow
+CPU_LOAD_HIGH = 0.95
+CPU_LOAD_LOW = 0.75
+# Pools shrink while less than this fraction of memory is available
+MEMORY_LOW_WATERMARK = 0.1
+# A new worker must raise throughput by this much to be kept
+THROUGHPUT_MIN_GAIN = 0.1
+# Decisions skipped after a change, to let measurements settle
+SETTLE_TICKS = 2
+# Decisions skipped after a worker added in vain was removed again
+HOLD_TICKS = 12
+
+
+class PoolKind(StrEnum):
+    INDEX = "index"
+    DOWNLOAD = "download"
+    EXTRACT_SLIDES = "extract_slides"
+
+
+@dataclass
+class WorkerLimits:
+    minimum: int
+    maximum: int
+
+    def __post_init__(self) -> None:
+        if not 1 <= self.minimum <= self.maximum:
+            raise ValueError(f"Invalid worker limits: {self.minimum}:{self.maximum}")
+
+    def clamp(self, workers: int) -> int:
+        return max(self.minimum, min(self.maximum, workers))
+
+    @staticmethod
+    def parse(text: str) -> Tuple[PoolKind, "WorkerLimits"]:
+        """
+        Parse `POOL=MIN:MAX` (or `POOL=N` for a fixed size), e.g. `download=2:16`.
+        Pool names may be spelled with hyphens, e.g. `extract-slides=1:2`.
+        """
+        pool, sep, bounds = text.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid worker limits: {text}")
+        pool = pool.strip().lower().replace("-", "_")
+        if pool not in [kind.value for kind in PoolKind]:
+            raise ValueError(
+                f"Unknown pool {pool!r}, expected one of "
+                + ", ".join(kind.value for kind in PoolKind)
+            )
+        minimum, _, maximum = bounds.partition(":")
+        return PoolKind(pool), WorkerLimits(int(minimum), int(maximum or minimum))
+
+
+@dataclass
+class PoolSample:
+    workers: int
+    busy: int
+    backlog: int
+    # Units of work per second (bytes for downloads), None if not measured
+    throughput: Optional[float] = None
+    # Throughput that cannot be exceeded anyway, e.g. a bandwidth limit
+    throughput_cap: Optional[float] = None
+
+
+class CpuLoadSampler:
+    """
+    Busy fraction of all CPUs since the previous sample, from /proc/stat.
+    Falls back to the 1 minute load average where /proc is not available.
+    """
+
+    def __init__(self) -> None:
+        self.__last: Optional[Tuple[int, int]] = self.__read_proc_stat()
+
+    @staticmethod
+    def __read_proc_stat() -> Optional[Tuple[int, int]]:
+        try:
+            with open("/proc/stat", "r") as f:
+                values = [int(v) for v in f.readline().split()[1:]]
+        except (OSError, ValueError):
+            return None
+        # idle + iowait
+        idle = values[3] + (values[4] if len(values) > 4 else 0)
+        return sum(values), idle
+
+    def sample(self) -> Optional[float]:
+        current = self.__read_proc_stat()
+        last, self.__last = self.__last, current
+        if current is not None and last is not None:
+            total = current[0] - last[0]
+            if total > 0:
+                return 1 - (current[1] - last[1]) / total
+        try:
+            return os.getloadavg()[0] / (os.cpu_count() or 1)
+        except (AttributeError, OSError):
+            return None
+
+
+def available_memory_fraction() -> Optional[float]:
+    try:
+        with open("/proc/meminfo", "r") as f:
+            info = {
+                name: int(value.split()[0])
+                for name, _, value in (line.partition(":") for line in f)
+                if value.strip()
+            }
+        return info["MemAvailable"] / info["MemTotal"]
+    except (OSError, KeyError, ValueError, ZeroDivisionError):
+        return None
+
+
+class PoolAutoscaler:
+    """
+    Picks the worker count of one pool from periodic samples.
+
+    CPU-bound pools grow while the machine has idle CPU and shrink when it is
+    saturated. Pools reporting throughput hill-climb: a worker is added while
+    tasks are waiting, and removed again if it did not raise throughput. Other
+    pools simply follow their backlog. Idle workers are retired one at a time.
+    """
+
+    def __init__(self, limits: WorkerLimits, cpu_bound: bool = False) -> None:
+        self.limits = limits
+        self.cpu_bound = cpu_bound
+        self.__cooldown = 0
+        # (workers, throughput) measured before the last worker was added
+        self.__baseline: Optional[Tuple[int, float]] = None
+
+    def decide(
+        self, sample: PoolSample, cpu_load: Optional[float], memory: Optional[float]
+    ) -> int:
+        target = self.limits.clamp(self.__decide(sample, cpu_load, memory))
+        if target != sample.workers and self.__cooldown == 0:
+            self.__cooldown = SETTLE_TICKS
+        return target
+
+    def __decide(
+        self, sample: PoolSample, cpu_load: Optional[float], memory: Optional[float]
+    ) -> int:
+        workers = sample.workers
+        if memory is not None and memory < MEMORY_LOW_WATERMARK:
+            return workers - 1
+        if self.__cooldown > 0:
+            self.__cooldown -= 1
+            return workers
+        if sample.backlog == 0:
+            self.__baseline = None
+            return workers - 1 if sample.busy < workers else workers
+
+        if self.cpu_bound:
+            if cpu_load is None:
+                return workers
+            if cpu_load > CPU_LOAD_HIGH:
+                return workers - 1
+            if cpu_load < CPU_LOAD_LOW:
+                return workers + 1
+            return workers
+
+        if cpu_load is not None and cpu_load > CPU_LOAD_HIGH:
+            # No CPU left to drive more transfers
+            return workers
+        if sample.throughput is None:
+            return workers + 1
+
+        baseline, self.__baseline = self.__baseline, None
+        if (
+            baseline is not None
+            and workers > baseline[0]
+            and sample.throughput < baseline[1] * (1 + THROUGHPUT_MIN_GAIN)
+        ):
+            # The last worker added did not help, e.g. the link is saturated
+            self.__cooldown = HOLD_TICKS
+            return workers - 1
+        if (
+            sample.throughput_cap is not None
+            and sample.throughput >= sample.throughput_cap * (1 - THROUGHPUT_MIN_GAIN)
+        ):
+            return workers
+        if workers < self.limits.maximum:
+            self.__baseline = (workers, sample.throughput)
+        return workers + 1
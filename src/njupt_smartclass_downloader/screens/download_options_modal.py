@@ -1,8 +1,9 @@
+import typing
 from typing import Optional, List, Tuple
 
 import textual
 from textual.app import ComposeResult
-from textual.widgets import Button, Label, SelectionList
+from textual.widgets import Button, Label, Select, SelectionList
 from textual.widgets.selection_list import Selection
 from textual.containers import Container, Horizontal, Vertical, ScrollableContainer
 from textual.screen import ModalScreen
@@ -10,6 +11,9 @@ from textual.binding import Binding
 
 from njupt_smartclass_downloader.app_task import DownloadOptions
 
+# Bandwidth weights offered, relative to downloads submitted at Normal
+BANDWIDTH_PRIORITIES = [("Low", 0.5), ("Normal", 1.0), ("High", 2.0), ("Highest", 4.0)]
+
 
 class DownloadOptionsModal(ModalScreen):
     BINDINGS = [
@@ -51,10 +55,27 @@ class DownloadOptionsModal(ModalScreen):
                     "extract-slides",
                     self.current_options.extract_slides,
                 ),
+                Selection(
+                    "Extract Slides while Downloading",
+                    "extract-slides-while-downloading",
+                    self.current_options.extract_slides_while_downloading,
+                ),
             ]
 
             yield SelectionList[str](*all_options, id="download-options-selection")
 
+            priorities = list(BANDWIDTH_PRIORITIES)
+            weight = self.current_options.bandwidth_weight
+            if weight not in (w for _, w in priorities):
+                priorities.append((f"Custom ({weight:g})", weight))
+            yield Label("Bandwidth Priority")
+            yield Select(
+                priorities,
+                value=weight,
+                allow_blank=False,
+                id="bandwidth-priority-select",
+            )
+
             with Horizontal(id="modal-buttons"):
                 yield Button("Download", variant="primary", id="modal-download-btn")
                 yield Button("Cancel", variant="default", id="modal-cancel-btn")
@@ -83,5 +104,14 @@ class DownloadOptionsModal(ModalScreen):
             if value in ["VGA", "Video1", "Video2", "Video3"]
         ]
         extract_slides = "extract-slides" in selected_values
-
-        return DownloadOptions(type_filter=type_filter, extract_slides=extract_slides)
+        extract_slides_while_downloading = (
+            "extract-slides-while-downloading" in selected_values
+        )
+        bandwidth_weight = self.query_one("#bandwidth-priority-select", Select).value
+
+        return DownloadOptions(
+            type_filter=type_filter,
+            extract_slides=extract_slides,
+            extract_slides_while_downloading=extract_slides_while_downloading,
+            bandwidth_weight=typing.cast(float, bandwidth_weight),
+        )
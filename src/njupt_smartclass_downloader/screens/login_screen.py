@@ -6,7 +6,10 @@ from textual.containers import Container, Horizontal, Vertical
 from textual.screen import Screen
 from textual.binding import Binding
 
-from njupt_smartclass_downloader.njupt_smartclass import NjuptSmartclass
+from njupt_smartclass_downloader.njupt_smartclass import (
+    SSO_SERVICE_URL,
+    NjuptSmartclass,
+)
 from njupt_smartclass_downloader.njupt_sso import NjuptSso
 from njupt_smartclass_downloader.screens.search_screen import SearchScreen
 from njupt_smartclass_downloader.app import NjuptSmartclassDownloaderApp
@@ -67,11 +70,21 @@ class LoginScreen(Screen):
         try:
             app.session.cookies.clear()
             sso.login(username, password)
-            sso.grant_service("https://njupt.smartclass.cn/SystemSpace/Redirect.aspx")
+            sso.grant_service(SSO_SERVICE_URL)
             app.smartclass = NjuptSmartclass(app.session)
+            app.task_manager.set_cookies(app.session.cookies)
         except Exception as e:
             self.app.notify(f"Login failed: {str(e)}", severity="error")
             return
+        try:
+            resumed = app.task_manager.resume_from_journal()
+        except Exception as e:
+            resumed = 0
+            self.app.notify(
+                f"Failed to resume unfinished tasks: {str(e)}", severity="warning"
+            )
+        if resumed:
+            self.app.notify(f"Resumed {resumed} unfinished task(s).")
         app.switch_screen(SearchScreen())
 
     @textual.on(Button.Pressed, "#quit-btn")
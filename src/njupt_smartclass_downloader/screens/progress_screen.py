@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import Dict, Optional
 import typing
 
 from cv2 import exp
@@ -10,7 +10,7 @@ from textual.binding import Binding
 
 from njupt_smartclass_downloader.widgets.task_list_item import TaskListItem
 from njupt_smartclass_downloader.app import NjuptSmartclassDownloaderApp
-from njupt_smartclass_downloader.app_task import TaskStatus
+from njupt_smartclass_downloader.app_task import TaskInfo, TaskStatus
 
 
 class ProgressScreen(Screen):
@@ -18,6 +18,11 @@ class ProgressScreen(Screen):
         Binding("b", "back", "Back", show=True),
         Binding("q", "quit", "Quit", show=True),
         Binding("s", "toggle_scroll_lock", "Toggle Scroll Lock", show=True),
+        Binding("plus,equals_sign", "raise_priority", "Priority +", show=True),
+        Binding("minus", "lower_priority", "Priority -", show=True),
+        Binding("p", "pause_task", "Pause", show=True),
+        Binding("c", "cancel_task", "Cancel", show=True),
+        Binding("r", "resume_task", "Resume", show=True),
     ]
 
     CSS_PATH = "../styles/progress.tcss"
@@ -52,6 +57,54 @@ class ProgressScreen(Screen):
         # Update status display with detailed task info
         self.update_status_display()
 
+    def action_raise_priority(self) -> None:
+        self.change_priority(1)
+
+    def action_lower_priority(self) -> None:
+        self.change_priority(-1)
+
+    def highlighted_task(self) -> Optional[TaskInfo]:
+        task_list = self.query_one("#task-list", ListView)
+        item = task_list.highlighted_child
+        if not isinstance(item, TaskListItem):
+            return None
+        return item.task_info
+
+    def action_pause_task(self) -> None:
+        app = typing.cast(NjuptSmartclassDownloaderApp, self.app)
+        task_info = self.highlighted_task()
+        if task_info is not None:
+            app.task_manager.pause_task(task_info.id)
+            self.auto_update()
+
+    def action_cancel_task(self) -> None:
+        app = typing.cast(NjuptSmartclassDownloaderApp, self.app)
+        task_info = self.highlighted_task()
+        if task_info is not None:
+            app.task_manager.cancel_task(task_info.id)
+            self.auto_update()
+
+    def action_resume_task(self) -> None:
+        app = typing.cast(NjuptSmartclassDownloaderApp, self.app)
+        task_info = self.highlighted_task()
+        if task_info is not None:
+            app.task_manager.resume_task(task_info.id)
+            self.auto_update()
+
+    def change_priority(self, delta: int) -> None:
+        """Change the priority of the highlighted task, see TaskManager.set_priority"""
+        app = typing.cast(NjuptSmartclassDownloaderApp, self.app)
+        task_info = self.highlighted_task()
+        if task_info is None:
+            return
+        priority = task_info.priority + delta
+        app.task_manager.set_priority(task_info.id, priority)
+        self.app.notify(
+            f"Priority of {task_info.display_name}: {priority}",
+            severity="information",
+        )
+        self.auto_update()
+
     def update_status_display(self) -> None:
         """Update the status display with task counts and auto-scroll state"""
         app = typing.cast(NjuptSmartclassDownloaderApp, self.app)
@@ -64,9 +117,18 @@ class ProgressScreen(Screen):
             1 for task in current_tasks if task.status == TaskStatus.COMPLETED
         )
         failed = sum(1 for task in current_tasks if task.status == TaskStatus.FAILED)
+        paused = sum(1 for task in current_tasks if task.status == TaskStatus.PAUSED)
+        cancelled = sum(
+            1 for task in current_tasks if task.status == TaskStatus.CANCELLED
+        )
 
         scroll_status = "ON" if self.auto_scroll_enabled else "OFF"
-        status_text = f"Auto-scroll: {scroll_status}, Queued: {queued}, Running: {running}, Completed: {completed}, Failed: {failed}"
+        status_text = f"Auto-scroll: {scroll_status}, Queued: {queued}, Running: {running}, Completed: {completed}, Failed: {failed}, Paused: {paused}, Cancelled: {cancelled}"
+        workers = app.task_manager.worker_counts()
+        if workers:
+            status_text += ", Workers: " + " ".join(
+                f"{kind}={count}" for kind, count in workers.items()
+            )
 
         status_widget = self.query_one("#scroll-status", Static)
         status_widget.update(status_text)
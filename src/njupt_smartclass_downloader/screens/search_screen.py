@@ -1,4 +1,3 @@
-import os
 from typing import Dict, List, Optional
 import typing
 
@@ -7,7 +6,6 @@ from textual.widgets import Static, ListView, Header, Footer
 from textual.containers import Container, Vertical
 from textual.screen import Screen
 from textual.binding import Binding
-from sanitize_filename import sanitize
 
 from njupt_smartclass_downloader import app_task
 from njupt_smartclass_downloader.njupt_smartclass import (
@@ -150,32 +148,8 @@ class SearchScreen(Screen):
             for item in selected_items:
                 resource = item.video
                 try:
-                    if resource.start_time.date() != resource.stop_time.date():
-                        sanitized_time_str = (
-                            resource.start_time.strftime("%Y%m%d%H%M")
-                            + "_"
-                            + resource.stop_time.strftime("%Y%m%d%H%M")
-                        )
-                    else:
-                        sanitized_time_str = (
-                            resource.start_time.strftime("%Y%m%d %H%M")
-                            + "_"
-                            + resource.stop_time.strftime("%H%M")
-                        )
-                    local_path = os.path.join(
-                        ".",
-                        "SmartclassDownload",
-                        sanitize(resource.course_name),
-                        sanitized_time_str,
-                    )
                     app.task_manager.submit_task(
-                        app_task.IndexTask(
-                            title=f"{resource.course_name} - {sanitized_time_str}",
-                            video_id=resource.id,
-                            local_path=local_path,
-                            cookies=app.session.cookies.copy(),
-                            options=options,
-                        )
+                        app_task.IndexTask.for_video(resource, options)
                     )
                 except Exception as e:
                     self.app.notify(
@@ -0,0 +1,170 @@
+from dataclasses import dataclass, field
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# Bumped whenever change rates or taskbar verdicts would come out differently,
+# which invalidates every cache written before
+ANALYSIS_VERSION = 1
+# Blocks hashed to recognize a video, spread evenly across the file
+FINGERPRINT_BLOCKS = 16
+FINGERPRINT_BLOCK_SIZE = 64 * 1024
+
+
+def video_fingerprint(path: str) -> str:
+    """
+    Hash of the size of a video and of blocks spread across it, which tells
+    videos apart without reading all of a large file.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, "rb") as f:
+        for i in range(FINGERPRINT_BLOCKS):
+            offset = (
+                max(0, size - FINGERPRINT_BLOCK_SIZE) * i // (FINGERPRINT_BLOCKS - 1)
+            )
+            f.seek(offset)
+            digest.update(f.read(FINGERPRINT_BLOCK_SIZE))
+    return digest.hexdigest()
+
+
+def default_cache_path(video_path: str) -> str:
+    return video_path + ".analysis.npz"
+
+
+def _empty_rates() -> np.ndarray:
+    return np.zeros(0, dtype=np.float32)
+
+
+@dataclass
+class AnalysisCache:
+    """
+    Change rates and taskbar verdicts of a video, so that it can be segmented
+    again with other parameters without decoding it again.
+
+    The change rate of every frame is kept against its reference frame, i.e.
+    the last change frame before it, both the approximate and the full
+    resolution rate (NaN where not computed). The references depend on the
+    threshold, so the rates are only valid for another threshold up to the
+    first frame at which it would change the references, see `replay`.
+    """
+
+    fingerprint: str
+    analysis_scale: float
+    # Change frames of the recorded run, i.e. the references of its rates
+    change_frames: List[int] = field(default_factory=list)
+    # Index after the last frame read
+    end_frame: int = 0
+    approximate_rates: np.ndarray = field(default_factory=_empty_rates)
+    full_rates: np.ndarray = field(default_factory=_empty_rates)
+    # Whether segments are fullscreen, see `filter_fullscreen_segments`
+    taskbar_verdicts: Dict[Tuple[int, int], bool] = field(default_factory=dict)
+
+    @staticmethod
+    def load(
+        path: str, fingerprint: str, analysis_scale: float
+    ) -> Optional["AnalysisCache"]:
+        """Returns None if there is no cache for this video and analysis scale."""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if (
+                    int(data["version"]) != ANALYSIS_VERSION
+                    or str(data["fingerprint"]) != fingerprint
+                    or float(data["analysis_scale"]) != analysis_scale
+                ):
+                    return None
+                return AnalysisCache(
+                    fingerprint,
+                    analysis_scale,
+                    [int(i) for i in data["change_frames"]],
+                    int(data["end_frame"]),
+                    data["approximate_rates"],
+                    data["full_rates"],
+                    {
+                        (int(start), int(end)): bool(verdict)
+                        for (start, end), verdict in zip(
+                            data["taskbar_segments"], data["taskbar_verdicts"]
+                        )
+                    },
+                )
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, path: str) -> None:
+        segments = list(self.taskbar_verdicts)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                version=ANALYSIS_VERSION,
+                fingerprint=self.fingerprint,
+                analysis_scale=self.analysis_scale,
+                change_frames=np.array(self.change_frames, dtype=np.int64),
+                end_frame=self.end_frame,
+                approximate_rates=self.approximate_rates,
+                full_rates=self.full_rates,
+                taskbar_segments=np.array(segments, dtype=np.int64).reshape(-1, 2),
+                taskbar_verdicts=np.array(
+                    [self.taskbar_verdicts[s] for s in segments], dtype=bool
+                ),
+            )
+        os.replace(tmp_path, path)
+
+    def replay(
+        self, threshold: float, pre_threshold: float
+    ) -> Tuple[List[int], Optional[int]]:
+        """
+        Change frames the analysis would find with `threshold`, as far as the
+        recorded rates decide them.
+
+        A frame is decided if its approximate rate is below `pre_threshold`, or
+        if its full resolution rate is known. At the first frame which is not
+        decided, or which is a change for `threshold` but was none when the
+        rates were recorded (or the other way around), the references part.
+
+        Returns:
+            Change frames before that frame, and the change frame from which
+            the video has to be analyzed again, None if all frames are decided
+        """
+        if not self.change_frames:
+            return [], 0
+        first = self.change_frames[0]
+        approximate = self.approximate_rates[first + 1 : self.end_frame]
+        full = self.full_rates[first + 1 : self.end_frame]
+        # NaN compares as False: an unknown approximate rate is not below
+        below = approximate < pre_threshold
+        decided = below | ~np.isnan(full)
+        changed = ~below & (full > threshold)
+        recorded = np.zeros(len(changed), dtype=bool)
+        recorded[np.array(self.change_frames[1:], dtype=np.int64) - first - 1] = True
+        mismatch = ~decided | (changed != recorded)
+        if not mismatch.any():
+            return list(self.change_frames), None
+        parted = first + 1 + int(np.argmax(mismatch))
+        change_frames = [i for i in self.change_frames if i < parted]
+        return change_frames[:-1], change_frames[-1]
+
+    def record(
+        self,
+        change_frames: List[int],
+        end_frame: int,
+        rates: List[Tuple[int, float, float]],
+    ) -> None:
+        """
+        Replace the recorded run by a new one, whose rates were replayed up to
+        the first of the new `rates` (frame, approximate, full).
+        """
+        approximate_rates = np.full(end_frame, np.nan, dtype=np.float32)
+        full_rates = np.full(end_frame, np.nan, dtype=np.float32)
+        kept = min(rates[0][0] if rates else end_frame, len(self.approximate_rates))
+        approximate_rates[:kept] = self.approximate_rates[:kept]
+        full_rates[:kept] = self.full_rates[:kept]
+        if rates:
+            frames, approximate, full = zip(*rates)
+            approximate_rates[list(frames)] = approximate
+            full_rates[list(frames)] = full
+        self.change_frames = change_frames
+        self.end_frame = end_frame
+        self.approximate_rates = approximate_rates
+        self.full_rates = full_rates
@@ -1,80 +1,231 @@
-from typing import Callable, Optional
+import io
+from typing import Callable, Dict, List, Optional, Tuple, Union
 import cv2
 from pathlib import Path
 
-from njupt_smartclass_downloader.slides_extractor.mode_frame import calculate_mode_frame
-from njupt_smartclass_downloader.slides_extractor.pdf_compositor import make_pdf
+from njupt_smartclass_downloader.slides_extractor.analysis_cache import (
+    AnalysisCache,
+    video_fingerprint,
+)
+from njupt_smartclass_downloader.slides_extractor.mode_frame import (
+    STABLE_CHANGE_FRACTION,
+    calculate_mode_frame,
+)
+from njupt_smartclass_downloader.slides_extractor.pdf_compositor import (
+    PdfCompositor,
+    PdfEncoding,
+)
 from njupt_smartclass_downloader.slides_extractor.significant_frame import (
+    ANALYSIS_SCALE,
     find_all_significant_frame,
+    find_all_significant_frame_cached,
+    find_all_significant_frame_parallel,
+)
+from njupt_smartclass_downloader.slides_extractor.single_pass import (
+    find_fullscreen_slides,
+)
+from njupt_smartclass_downloader.slides_extractor.slide_index import (
+    Slide,
+    SlideIndex,
+    save_hash_index,
 )
 from njupt_smartclass_downloader.slides_extractor.taskbar_detector import (
     filter_fullscreen_segments,
 )
 
 
+def _find_slides_multi_pass(
+    cap: cv2.VideoCapture,
+    threshold: float,
+    all_segments: List[Tuple[int, int]],
+    report_progress: Optional[Callable[[str, int, int], None]],
+    mode_samples: Optional[int],
+    mode_stable_fraction: Optional[float],
+    deduplicate: bool,
+    on_slide: Callable[[Slide], None],
+    taskbar_verdicts: Optional[Dict[Tuple[int, int], bool]] = None,
+) -> List[Slide]:
+    if report_progress:
+        report_progress("Filtering", 0, len(all_segments))
+    fullscreen_segments = filter_fullscreen_segments(
+        cap, all_segments, taskbar_verdicts
+    )
+    if report_progress:
+        report_progress("Filtering", len(all_segments), len(all_segments))
+
+    slide_index = SlideIndex(threshold, deduplicate, on_slide)
+    n_mode_frame_to_calculate = sum(
+        end_frame - start_frame for start_frame, end_frame in fullscreen_segments
+    )
+    n_mode_frame_calculated = 0
+
+    for start_frame, end_frame in fullscreen_segments:
+        if deduplicate:
+            # A slide seen before need not be composited again
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+            ret, first_frame = cap.read()
+            slide = slide_index.find(first_frame) if ret else None
+            if slide is not None:
+                slide_index.merge(slide, (start_frame, end_frame))
+                n_mode_frame_calculated += end_frame - start_frame
+                continue
+        try:
+            mode_frame = calculate_mode_frame(
+                cap,
+                start_frame,
+                end_frame,
+                lambda current, _: (
+                    report_progress(
+                        "Compositing",
+                        n_mode_frame_calculated + current,
+                        n_mode_frame_to_calculate,
+                    )
+                    if report_progress
+                    else None
+                ),
+                mode_samples,
+                mode_stable_fraction,
+            )
+        except ValueError:
+            # The first frame of the segment cannot be read
+            mode_frame = None
+        n_mode_frame_calculated += end_frame - start_frame
+        if mode_frame is not None:
+            slide_index.add((start_frame, end_frame), mode_frame)
+    return slide_index.slides
+
+
 def extract_slides(
-    video_input: str,
+    video_input: Union[str, io.BufferedIOBase],
     pdf_output: str,
     threshold: float = 0.02,
     min_time_gap: float = 3,
     report_progress: Optional[Callable[[str, int, int], None]] = None,
+    analysis_scale: float = ANALYSIS_SCALE,
+    sample_interval: int = 1,
+    processes: int = 1,
+    mode_samples: Optional[int] = None,
+    mode_stable_fraction: Optional[float] = STABLE_CHANGE_FRACTION,
+    deduplicate: bool = False,
+    hash_index_output: Optional[str] = None,
+    pdf_encoding: Optional[PdfEncoding] = None,
+    analysis_cache: Optional[str] = None,
 ):
+    """
+    Args:
+        video_input: Path of the video, or a seekable binary stream of it,
+            e.g. a file still being downloaded. A stream is decoded by FFmpeg
+            and cannot be split across several processes.
+        analysis_cache: Keep change rates and taskbar verdicts in this file,
+            see `AnalysisCache`, so that running again with another threshold
+            or time gap only decodes what the cache cannot answer. Every frame
+            is analyzed sequentially then, regardless of `sample_interval` and
+            `processes`. Requires a path as `video_input`.
+        mode_stable_fraction: See `calculate_mode_frame`, only used with
+            `mode_samples`
+    """
     cap = None
+    compositor = None
     try:
-        cap = cv2.VideoCapture(video_input)
+        if isinstance(video_input, str):
+            cap = cv2.VideoCapture(video_input)
+        elif processes > 1:
+            raise ValueError("Several processes need a path to the video")
+        else:
+            cap = cv2.VideoCapture(video_input, cv2.CAP_FFMPEG, [])
         if not cap.isOpened():
             raise ValueError(f"Cannot open video: {video_input}")
         fps = cap.get(cv2.CAP_PROP_FPS)
         video_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         video_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        all_segments = find_all_significant_frame(
-            cap,
-            threshold,
-            int(min_time_gap * fps),
-            lambda current, total: (
-                report_progress(f"Analyzing", current, total)
-                if report_progress
-                else None
-            ),
+        # Slides are written as soon as they are composited
+        compositor = PdfCompositor(pdf_output, video_width, video_height, pdf_encoding)
+        on_slide = lambda slide: compositor.add_slide(
+            slide.title(len(compositor.titles) + 1), slide.mode_frame
         )
-
-        if report_progress:
-            report_progress("Filtering", 0, len(all_segments))
-        fullscreen_segments = filter_fullscreen_segments(cap, all_segments)
-        if report_progress:
-            report_progress("Filtering", len(all_segments), len(all_segments))
-
-        n_mode_frame_to_calculate = sum(
-            end_frame - start_frame for start_frame, end_frame in fullscreen_segments
+        report_analyzing_progress = lambda current, total: (
+            report_progress(f"Analyzing", current, total) if report_progress else None
         )
-        n_mode_frame_calculated = 0
-
-        slides = []
-        for i, (start_frame, end_frame) in enumerate(fullscreen_segments):
-            mode_frame = calculate_mode_frame(
+        if analysis_cache is not None:
+            if not isinstance(video_input, str):
+                raise ValueError("An analysis cache needs a path to the video")
+            fingerprint = video_fingerprint(video_input)
+            cache = AnalysisCache.load(
+                analysis_cache, fingerprint, analysis_scale
+            ) or AnalysisCache(fingerprint, analysis_scale)
+            all_segments = find_all_significant_frame_cached(
                 cap,
-                start_frame,
-                end_frame,
-                lambda current, _: (
-                    report_progress(
-                        "Compositing",
-                        n_mode_frame_calculated + current,
-                        n_mode_frame_to_calculate,
-                    )
-                    if report_progress
-                    else None
-                ),
+                threshold,
+                int(min_time_gap * fps),
+                cache,
+                report_analyzing_progress,
             )
-            n_mode_frame_calculated += end_frame - start_frame
-            slides.append(
-                (f"Slide {i+1} (frames {start_frame}-{end_frame - 1})", mode_frame)
+            found_slides = _find_slides_multi_pass(
+                cap,
+                threshold,
+                all_segments,
+                report_progress,
+                mode_samples,
+                mode_stable_fraction,
+                deduplicate,
+                on_slide,
+                cache.taskbar_verdicts,
+            )
+            cache.save(analysis_cache)
+        elif processes <= 1 and sample_interval == 1:
+            # Every frame is decoded anyway, so do everything in that pass
+            found_slides = find_fullscreen_slides(
+                cap,
+                threshold,
+                int(min_time_gap * fps),
+                report_analyzing_progress,
+                analysis_scale,
+                mode_samples,
+                mode_stable_fraction,
+                deduplicate,
+                on_slide,
+            )
+        else:
+            if processes > 1:
+                all_segments = find_all_significant_frame_parallel(
+                    video_input,
+                    threshold,
+                    int(min_time_gap * fps),
+                    processes,
+                    report_analyzing_progress,
+                    analysis_scale,
+                    sample_interval,
+                )
+            else:
+                all_segments = find_all_significant_frame(
+                    cap,
+                    threshold,
+                    int(min_time_gap * fps),
+                    report_analyzing_progress,
+                    analysis_scale,
+                    sample_interval,
+                )
+            found_slides = _find_slides_multi_pass(
+                cap,
+                threshold,
+                all_segments,
+                report_progress,
+                mode_samples,
+                mode_stable_fraction,
+                deduplicate,
+                on_slide,
             )
 
         if report_progress:
-            report_progress("Saving", 0, len(slides))
-        make_pdf(slides, pdf_output, video_width, video_height)
+            report_progress("Saving", 0, len(found_slides))
+        # Merging repeated slides may have added segments to earlier titles
+        for i, slide in enumerate(found_slides):
+            compositor.set_title(i, slide.title(i + 1))
+        compositor.close()
         if report_progress:
-            report_progress("Saving", len(slides), len(slides))
+            report_progress("Saving", len(found_slides), len(found_slides))
+        if hash_index_output:
+            save_hash_index(found_slides, hash_index_output)
 
         return 0
 
@@ -82,5 +233,8 @@ def extract_slides(
         return 1
 
     finally:
+        if compositor is not None:
+            # Encoding threads would outlive a failed job in a pooled worker
+            compositor.abort()
         if cap and cap.isOpened():
             cap.release()
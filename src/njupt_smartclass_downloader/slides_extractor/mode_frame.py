@@ -1,14 +1,203 @@
-from typing import Callable, Optional
+from typing import Callable, List, Optional, Sequence
 import cv2
 import numpy as np
 
+# Votes are counted in 16 bits and saturate instead of wrapping around
+COUNT_DTYPE = np.uint16
+MAX_COUNT = np.iinfo(COUNT_DTYPE).max
+# A sample replacing the candidates of at most this fraction of pixels leaves
+# the mode frame stable
+STABLE_CHANGE_FRACTION = 0.0005
+# Consecutive stable samples after which the mode frame is considered converged
+STABLE_FRAMES = 5
+# Sampled frames further apart than this are seeked to instead of grabbed
+SEEK_DISTANCE = 50
+
+
+class ModeFrameAccumulator:
+    """
+    Per-pixel Boyer-Moore majority vote over a stream of frames.
+
+    All state lives in buffers allocated on the second frame, adding a frame
+    does not allocate. With `pack_pixels`, BGR pixels are padded to 4 bytes so
+    that each pixel is compared as a single uint32.
+
+    With `stable_fraction`, frames replacing the candidates of at most that
+    fraction of pixels are counted, see `is_stable`.
+    """
+
+    def __init__(
+        self,
+        first_frame: np.ndarray,
+        pack_pixels: bool = True,
+        stable_fraction: Optional[float] = None,
+    ) -> None:
+        self.__first_frame = first_frame
+        self.__stable_fraction = stable_fraction
+        self.__pack_pixels = pack_pixels and first_frame.shape[2:] == (3,)
+        # Boyer-Moore state is allocated on the second frame, a segment of a
+        # single frame does not need it
+        self.__candidates: Optional[np.ndarray] = None
+        self.__counts: Optional[np.ndarray] = None
+        self.frame_count = 1
+        # Consecutive frames which barely changed the candidates
+        self.stable_frames = 0
+
+    def __allocate(self) -> None:
+        first_frame = self.__first_frame
+        height, width = first_frame.shape[:2]
+        if self.__pack_pixels:
+            # BGRX layouts of the candidates and of the frame being added
+            self.__candidates = np.zeros((height, width, 4), dtype=np.uint8)
+            self.__candidates[..., :3] = first_frame
+            self.__frame = np.zeros((height, width, 4), dtype=np.uint8)
+            self.__candidates_packed = self.__candidates.view(np.uint32)[..., 0]
+            self.__frame_packed = self.__frame.view(np.uint32)[..., 0]
+        else:
+            self.__candidates = first_frame.copy()
+            self.__equal = np.zeros(first_frame.shape, dtype=bool)
+        self.__counts = np.ones((height, width), dtype=COUNT_DTYPE)
+        self.__matches = np.zeros((height, width), dtype=bool)
+        self.__mask = np.zeros((height, width), dtype=bool)
+
+    @property
+    def is_stable(self) -> bool:
+        return self.stable_frames >= STABLE_FRAMES
+
+    def add(self, frame: np.ndarray) -> None:
+        if self.__candidates is None:
+            self.__allocate()
+        counts = self.__counts
+        matches = self.__matches
+        mask = self.__mask
+
+        if self.__pack_pixels:
+            np.copyto(self.__frame[..., :3], frame)
+            np.equal(self.__frame_packed, self.__candidates_packed, out=matches)
+        else:
+            np.equal(frame, self.__candidates, out=self.__equal)
+            np.logical_and.reduce(self.__equal, axis=2, out=matches)
+
+        # Every count is at least 1, so decrementing never wraps around
+        np.logical_not(matches, out=mask)
+        np.subtract(counts, mask, out=counts, casting="unsafe")
+        np.less(counts, MAX_COUNT, out=mask)
+        np.logical_and(matches, mask, out=matches)
+        np.add(counts, matches, out=counts, casting="unsafe")
+
+        # Update candidates where count became zero
+        np.equal(counts, 0, out=mask)
+        if self.__pack_pixels:
+            np.copyto(self.__candidates_packed, self.__frame_packed, where=mask)
+        else:
+            np.copyto(self.__candidates, frame, where=mask[..., np.newaxis])
+        np.add(counts, mask, out=counts, casting="unsafe")
+
+        self.frame_count += 1
+        if self.__stable_fraction is not None:
+            if np.count_nonzero(mask) <= self.__stable_fraction * mask.size:
+                self.stable_frames += 1
+            else:
+                self.stable_frames = 0
+
+    def result(self) -> np.ndarray:
+        if self.__candidates is None:
+            return self.__first_frame
+        if self.__pack_pixels:
+            return np.ascontiguousarray(self.__candidates[..., :3])
+        return self.__candidates
+
+
+def spread_order(n: int) -> List[int]:
+    """
+    The indices of `n` evenly spread samples from coarse to fine: both ends,
+    the middle, the quarters and so on, in increasing order within each round.
+    Every prefix is spread across the whole range, so that compositing can
+    stop early without leaving a part of the segment out.
+    """
+    if n <= 1:
+        return list(range(n))
+    order = [0, n - 1]
+    intervals = [(0, n - 1)]
+    while intervals:
+        halves = []
+        for lo, hi in intervals:
+            if hi - lo > 1:
+                mid = (lo + hi) // 2
+                order.append(mid)
+                halves += [(lo, mid), (mid, hi)]
+        intervals = halves
+    return order
+
+
+def composite_frames(
+    frames: Sequence[np.ndarray], stable_fraction: Optional[float]
+) -> np.ndarray:
+    """
+    Mode frame of samples given in frame order, added coarse to fine and
+    stopping once it is stable.
+    """
+    order = spread_order(len(frames))
+    accumulator = ModeFrameAccumulator(
+        frames[order[0]], stable_fraction=stable_fraction
+    )
+    for i in order[1:]:
+        accumulator.add(frames[i])
+        if accumulator.is_stable:
+            break
+    return accumulator.result()
+
+
+def _calculate_mode_frame_sampled(
+    cap: cv2.VideoCapture,
+    accumulator: ModeFrameAccumulator,
+    start_frame: int,
+    frame_count: int,
+    max_samples: int,
+    report_progress: Optional[Callable[[int, int], None]],
+) -> np.ndarray:
+    n_samples = max(2, min(max_samples, frame_count))
+    # The first frame has been read already
+    next_frame_idx = start_frame + 1
+    for n_done, i in enumerate(spread_order(n_samples)[1:], start=2):
+        frame_idx = start_frame + i * (frame_count - 1) // (n_samples - 1)
+        if frame_idx < next_frame_idx or frame_idx - next_frame_idx > SEEK_DISTANCE:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+        else:
+            while next_frame_idx < frame_idx and cap.grab():
+                next_frame_idx += 1
+        ret, frame = cap.read()
+        next_frame_idx = frame_idx + 1
+        if not ret:
+            continue
+
+        accumulator.add(frame)
+        if report_progress:
+            report_progress(n_done * frame_count // n_samples, frame_count)
+        if accumulator.is_stable:
+            break
+
+    if report_progress:
+        report_progress(frame_count, frame_count)
+    return accumulator.result()
+
 
 def calculate_mode_frame(
     cap: cv2.VideoCapture,
     start_frame: int,
     end_frame: int,
     report_progress: Optional[Callable[[int, int], None]] = None,
+    max_samples: Optional[int] = None,
+    stable_fraction: Optional[float] = STABLE_CHANGE_FRACTION,
 ) -> np.ndarray:
+    """
+    Args:
+        max_samples: Composite at most this many frames spread evenly across
+            the segment, see `spread_order`. By default every frame is used.
+        stable_fraction: With `max_samples`, stop once STABLE_FRAMES samples
+            in a row replaced at most this fraction of the pixels, None to
+            use every sample
+    """
     frame_count = end_frame - start_frame
     if frame_count <= 0:
         raise ValueError(f"Invalid frame range [{start_frame}, {end_frame})")
@@ -26,29 +215,23 @@ def calculate_mode_frame(
             report_progress(1, 1)
         return first_frame
 
-    height, width = first_frame.shape[:2]
-
-    # Initialize Boyer-Moore state for all pixels
-    candidates = first_frame.copy()  # Shape: (height, width, channels)
-    counts = np.ones((height, width), dtype=np.int32)
-    matches = np.zeros((height, width), dtype=bool)
+    if max_samples is not None:
+        accumulator = ModeFrameAccumulator(first_frame, stable_fraction=stable_fraction)
+        return _calculate_mode_frame_sampled(
+            cap, accumulator, start_frame, frame_count, max_samples, report_progress
+        )
 
+    accumulator = ModeFrameAccumulator(first_frame)
     # Process remaining frames sequentially
     for frame_idx in range(1, frame_count):
         ret, frame = cap.read()
         if not ret:
             continue
 
-        np.all(frame == candidates, axis=2, out=matches)  # Shape: (height, width)
-        counts += np.where(matches, 1, -1)
-
-        # Update candidates where count became zero
-        zero_mask = counts == 0
-        candidates[zero_mask] = frame[zero_mask]
-        counts[zero_mask] = 1
+        accumulator.add(frame)
 
         # Report progress
         if frame_idx % 50 == 0 or frame_idx == frame_count - 1:
             if report_progress:
                 report_progress(frame_idx + 1, frame_count)
-    return candidates
+    return accumulator.result()
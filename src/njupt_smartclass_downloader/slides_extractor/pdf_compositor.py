@@ -1,51 +1,216 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from enum import StrEnum
+import io
 import cv2
 import numpy as np
 from PIL import Image
 from reportlab.pdfgen import canvas
 from reportlab.lib.utils import ImageReader
-from typing import List, Tuple
+from typing import Any, Deque, List, Optional, Tuple, Union
 
+# Mean per-channel error up to which a palette represents a slide faithfully
+PALETTE_MAX_ERROR = 2.0
 
-def make_pdf(
-    frames_data: List[Tuple[str, np.ndarray]],
-    output_path: str,
+
+class ImageFormat(StrEnum):
+    # Lossless, compressed by reportlab
+    FLATE = "flate"
+    # Embedded as is, without being decoded and compressed again
+    JPEG = "jpeg"
+    # Quantized to a palette first, which compresses flat slides much better
+    PALETTE = "palette"
+    # Palette for flat slides, JPEG for the rest
+    AUTO = "auto"
+
+
+@dataclass
+class PdfEncoding:
+    image_format: ImageFormat = ImageFormat.FLATE
+    jpeg_quality: int = 85
+    palette_colors: int = 64
+    # Resolution images are downscaled to, assuming 72 points per inch
+    max_dpi: Optional[float] = None
+    # Threads encoding pages before they are added to the PDF
+    workers: int = 1
+
+
+def _to_image(frame: np.ndarray) -> Image.Image:
+    # handle grayscale frames
+    if len(frame.shape) == 2:  # Grayscale frame
+        return Image.fromarray(frame, "L")
+    elif frame.shape[2] == 1:  # Single channel
+        return Image.fromarray(frame[:, :, 0], "L")
+    else:  # Color frame
+        return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), "RGB")
+
+
+def _quantize(img: Image.Image, colors: int) -> Tuple[Image.Image, float]:
+    """Returns the image reduced to a palette and its mean error."""
+    quantized = img.quantize(colors).convert(img.mode)
+    error = np.mean(
+        np.abs(np.asarray(img, dtype=np.int16) - np.asarray(quantized, dtype=np.int16))
+    )
+    return quantized, float(error)
+
+
+def _encode_jpeg(img: Image.Image, quality: int) -> io.BytesIO:
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=quality, optimize=True)
+    buffer.seek(0)
+    return buffer
+
+
+def encode_page(
+    frame: np.ndarray,
     paper_width: int,
     paper_height: int,
-    title: str = "Slides",
-) -> None:
-    c = canvas.Canvas(output_path, pagesize=(paper_width, paper_height))
+    encoding: PdfEncoding,
+) -> Tuple[Union[Image.Image, io.BytesIO], Tuple[int, int]]:
+    """
+    Prepare the image of a page. Independent of the PDF being written, so that
+    pages may be encoded concurrently.
+
+    Returns:
+        Image or encoded JPEG for `ImageReader`, and the size of the frame
+    """
+    img = _to_image(frame)
+    size = img.size
+
+    if encoding.max_dpi is not None:
+        scale = min(paper_width / size[0], paper_height / size[1])
+        max_width = round(size[0] * scale / 72 * encoding.max_dpi)
+        if max_width < size[0]:
+            max_height = max(1, round(size[1] * max_width / size[0]))
+            img = img.resize((max(1, max_width), max_height), Image.Resampling.LANCZOS)
+
+    if encoding.image_format == ImageFormat.JPEG:
+        return _encode_jpeg(img, encoding.jpeg_quality), size
+    if encoding.image_format in (ImageFormat.PALETTE, ImageFormat.AUTO):
+        quantized, error = _quantize(img, encoding.palette_colors)
+        if encoding.image_format == ImageFormat.PALETTE or error <= PALETTE_MAX_ERROR:
+            return quantized, size
+        return _encode_jpeg(img, encoding.jpeg_quality), size
+    return img, size
+
+
+class PdfCompositor:
+    """
+    Writes slides to a PDF one at a time, as they are produced. Each slide is
+    encoded and drawn right away, so only the slides being encoded are held in
+    memory. With several encoding workers, up to that many slides are encoded
+    concurrently and drawn in order.
 
-    for i, (title, frame) in enumerate(frames_data):
+    Outline entries are added on `close`, so titles may still change after a
+    slide has been added.
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        paper_width: int,
+        paper_height: int,
+        encoding: Optional[PdfEncoding] = None,
+    ) -> None:
+        self.paper_width = paper_width
+        self.paper_height = paper_height
+        self.encoding = encoding or PdfEncoding()
+        self.titles: List[str] = []
+        self.__canvas = canvas.Canvas(output_path, pagesize=(paper_width, paper_height))
+        self.__bookmarks: List[Optional[str]] = []
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__pending: Deque[Tuple[int, Future]] = deque()
+        if self.encoding.workers > 1:
+            self.__executor = ThreadPoolExecutor(max_workers=self.encoding.workers)
+
+    def __encode(self, frame: np.ndarray):
+        try:
+            return encode_page(
+                frame, self.paper_width, self.paper_height, self.encoding
+            )
+        except Exception as e:
+            return None
+
+    def __draw(self, index: int, page) -> None:
+        if page is None:
+            return
         try:
-            # handle grayscale frames
-            if len(frame.shape) == 2:  # Grayscale frame
-                img = Image.fromarray(frame, "L")
-            elif frame.shape[2] == 1:  # Single channel
-                img = Image.fromarray(frame[:, :, 0], "L")
-            else:  # Color frame
-                img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), "RGB")
-
-            img_width, img_height = img.size
-            scale = min(paper_width / img_width, paper_height / img_height)
+            image, (img_width, img_height) = page
+            scale = min(self.paper_width / img_width, self.paper_height / img_height)
             new_width = img_width * scale
             new_height = img_height * scale
-            x_offset = (paper_width - new_width) / 2
-            y_offset = (paper_height - new_height) / 2
+            x_offset = (self.paper_width - new_width) / 2
+            y_offset = (self.paper_height - new_height) / 2
+            c = self.__canvas
             c.drawImage(
-                ImageReader(img),
+                ImageReader(image),
                 x_offset,
                 y_offset,
                 width=new_width,
                 height=new_height,
             )
 
-            bookmark_key = f"slide_{i + 1}"
+            bookmark_key = f"slide_{index + 1}"
             c.bookmarkPage(bookmark_key)
-            c.addOutlineEntry(title, bookmark_key, level=0)
+            self.__bookmarks[index] = bookmark_key
 
             c.showPage()
 
         except Exception as e:
-            continue
+            return
+
+    def add_slide(self, title: str, frame: np.ndarray) -> int:
+        """Returns the index of the slide."""
+        index = len(self.titles)
+        self.titles.append(title)
+        self.__bookmarks.append(None)
+        if self.__executor is None:
+            self.__draw(index, self.__encode(frame))
+            return index
+        while len(self.__pending) >= self.encoding.workers:
+            self.__draw(*self.__next_encoded())
+        self.__pending.append((index, self.__executor.submit(self.__encode, frame)))
+        return index
+
+    def __next_encoded(self) -> Tuple[int, Any]:
+        pending_index, future = self.__pending.popleft()
+        return pending_index, future.result()
+
+    def set_title(self, index: int, title: str) -> None:
+        self.titles[index] = title
+
+    def abort(self) -> None:
+        """
+        Stop encoding slides, e.g. after a failure, without writing the PDF.
+        Does nothing once closed.
+        """
+        if self.__executor is not None:
+            self.__executor.shutdown(cancel_futures=True)
+            self.__executor = None
+        self.__pending.clear()
 
-    c.save()
+    def close(self) -> None:
+        try:
+            while self.__pending:
+                self.__draw(*self.__next_encoded())
+        finally:
+            self.abort()
+        for title, bookmark_key in zip(self.titles, self.__bookmarks):
+            if bookmark_key is not None:
+                self.__canvas.addOutlineEntry(title, bookmark_key, level=0)
+        self.__canvas.save()
+
+
+def make_pdf(
+    frames_data: List[Tuple[str, np.ndarray]],
+    output_path: str,
+    paper_width: int,
+    paper_height: int,
+    title: str = "Slides",
+    encoding: Optional[PdfEncoding] = None,
+) -> None:
+    compositor = PdfCompositor(output_path, paper_width, paper_height, encoding)
+    for title, frame in frames_data:
+        compositor.add_slide(title, frame)
+    compositor.close()
@@ -1,21 +1,35 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import math
 import cv2
 import numpy as np
 from typing import Callable, List, Optional, Tuple
 
+from njupt_smartclass_downloader.slides_extractor.analysis_cache import AnalysisCache
 
-def detect_significant_changes(frame1: np.ndarray, frame2: np.ndarray) -> float:
-    """
-    Detect significant changes while filtering out noise.
+# Per-pixel grayscale difference counted as a change
+PIXEL_DIFF_THRESHOLD = 30
+# Changed regions smaller than this (in full resolution pixels) are noise
+MIN_CHANGE_AREA = 1000
+# Scale of the grayscale image the cheap change rate is computed on
+ANALYSIS_SCALE = 0.25
+# Fraction of the change threshold the cheap change rate must reach before the
+# full resolution analysis is run
+PRE_THRESHOLD_RATIO = 0.5
+# Chunks a video is split into per worker process in parallel analysis
+CHUNKS_PER_PROCESS = 4
+# Chunks shorter than this are not worth a seek and a process of their own
+MIN_CHUNK_FRAMES = 1500
 
-    Returns:
-        Change rate
-    """
-    gray1 = cv2.cvtColor(frame1, cv2.COLOR_BGR2GRAY)
-    gray2 = cv2.cvtColor(frame2, cv2.COLOR_BGR2GRAY)
 
+def _contour_change_rate(
+    gray1: np.ndarray,
+    gray2: np.ndarray,
+    min_area: float = MIN_CHANGE_AREA,
+    blur_size: int = 5,
+) -> float:
     diff = cv2.absdiff(gray1, gray2)
-    diff = cv2.GaussianBlur(diff, (5, 5), 0)
-    _, thresh = cv2.threshold(diff, 30, 255, cv2.THRESH_BINARY)
+    diff = cv2.GaussianBlur(diff, (blur_size, blur_size), 0)
+    _, thresh = cv2.threshold(diff, PIXEL_DIFF_THRESHOLD, 255, cv2.THRESH_BINARY)
 
     contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
@@ -24,56 +38,449 @@ def detect_significant_changes(frame1: np.ndarray, frame2: np.ndarray) -> float:
 
     for contour in contours:
         area = cv2.contourArea(contour)
-        if area > 1000:
+        if area > min_area:
             significant_changes += area
 
     change_rate = significant_changes / total_pixels
     return change_rate
 
 
-def find_all_significant_frame(
+def detect_significant_changes(frame1: np.ndarray, frame2: np.ndarray) -> float:
+    """
+    Detect significant changes while filtering out noise.
+
+    Returns:
+        Change rate
+    """
+    gray1 = cv2.cvtColor(frame1, cv2.COLOR_BGR2GRAY)
+    gray2 = cv2.cvtColor(frame2, cv2.COLOR_BGR2GRAY)
+    return _contour_change_rate(gray1, gray2)
+
+
+class ChangeDetector:
+    """
+    Change rate of frames against a reference frame, as computed by
+    `detect_significant_changes`, without redoing work for every frame.
+
+    The reference is converted to grayscale once, when it is set. Each frame is
+    first analyzed on a downscaled grayscale image, which is an order of
+    magnitude cheaper; only frames whose approximate change rate reaches
+    `pre_threshold` are analyzed again at full resolution.
+    """
+
+    def __init__(self, pre_threshold: float, scale: float = ANALYSIS_SCALE) -> None:
+        """
+        Args:
+            pre_threshold: Approximate change rate from which a frame is
+                analyzed at full resolution
+            scale: Scale of the downscaled image, 1 analyzes every frame at
+                full resolution only
+        """
+        self.pre_threshold = pre_threshold
+        self.scale = scale
+        self.__reference_gray: Optional[np.ndarray] = None
+        self.__reference_small: Optional[np.ndarray] = None
+
+    def __downscale(self, gray: np.ndarray) -> np.ndarray:
+        # Area averaging also smooths out compression noise
+        return cv2.resize(
+            gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA
+        )
+
+    def set_reference(self, frame: np.ndarray) -> None:
+        self.__reference_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.scale < 1:
+            self.__reference_small = self.__downscale(self.__reference_gray)
+
+    def change_rates(self, frame: np.ndarray) -> Tuple[float, float]:
+        """
+        Returns:
+            Approximate and full resolution change rate, NaN where not computed
+        """
+        if self.__reference_gray is None:
+            raise ValueError("No reference frame")
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        approximate = math.nan
+        if self.__reference_small is not None:
+            approximate = _contour_change_rate(
+                self.__reference_small,
+                self.__downscale(gray),
+                min_area=MIN_CHANGE_AREA * self.scale * self.scale,
+                blur_size=3,
+            )
+            if approximate < self.pre_threshold:
+                return approximate, math.nan
+        return approximate, _contour_change_rate(self.__reference_gray, gray)
+
+    def change_rate(self, frame: np.ndarray) -> float:
+        approximate, full = self.change_rates(frame)
+        return approximate if math.isnan(full) else full
+
+
+def _read_frame_at(cap: cv2.VideoCapture, frame_idx: int) -> Optional[np.ndarray]:
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+    ret, frame = cap.read()
+    return frame if ret else None
+
+
+def _bisect_change(
     cap: cv2.VideoCapture,
+    detector: ChangeDetector,
     threshold: float,
-    min_frame_gap: int,
+    lo: int,
+    hi: int,
+    hi_frame: np.ndarray,
+) -> Tuple[int, np.ndarray]:
+    """
+    Find the first frame in (lo, hi] that differs from the reference, given
+    that frame `lo` does not and frame `hi` does.
+
+    Slides do not change back within a sampling interval in practice, so the
+    change rate is assumed to stay above the threshold once it is exceeded.
+
+    Returns:
+        Index and image of the first changed frame
+    """
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        frame = _read_frame_at(cap, mid)
+        if frame is not None and detector.change_rate(frame) > threshold:
+            hi, hi_frame = mid, frame
+        else:
+            lo = mid
+    return hi, hi_frame
+
+
+def _find_change_frames(
+    cap: cv2.VideoCapture,
+    threshold: float,
+    start_frame: int = 0,
+    end_frame: Optional[int] = None,
     report_progress: Optional[Callable[[int, int], None]] = None,
-) -> List[Tuple[int, int]]:
-    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    analysis_scale: float = ANALYSIS_SCALE,
+    sample_interval: int = 1,
+    on_change_rate: Optional[Callable[[int, float, float], None]] = None,
+) -> Tuple[List[int], int]:
+    """
+    Find the frames in [start_frame, end_frame) from which the picture differs
+    significantly from the previous reference frame.
+
+    Args:
+        on_change_rate: Called with the index and `ChangeDetector.change_rates`
+            of every frame compared against its reference, in frame order if
+            `sample_interval` is 1
+
+    Returns:
+        Change frames, beginning with the first frame read, and the index
+        after the last frame read
+    """
+    if sample_interval < 1:
+        raise ValueError(f"Invalid sample interval {sample_interval}")
+
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
     frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
-    prev_frame = None
-    segment_start = 0
-    segments = []  # Collect all segments in a list
-    frame_idx = -1
+    detector = ChangeDetector(threshold * PRE_THRESHOLD_RATIO, analysis_scale)
+    has_reference = False
+    change_frames: List[int] = []
+    frame_idx = start_frame - 1
+    # Last analyzed frame, which does not differ from the reference
+    last_sample_idx = start_frame - 1
+
+    def change_rate(sample_idx: int, frame: np.ndarray) -> float:
+        if on_change_rate is None:
+            return detector.change_rate(frame)
+        approximate, full = detector.change_rates(frame)
+        on_change_rate(sample_idx, approximate, full)
+        return approximate if math.isnan(full) else full
+
+    def analyze(sample_idx: int, frame: np.ndarray) -> bool:
+        """Returns whether the capture was moved away to find a change."""
+        nonlocal last_sample_idx
+        seeked = False
+        # Several slides may have been shown between two samples
+        while change_rate(sample_idx, frame) > threshold:
+            change_idx, change_frame = sample_idx, frame
+            if sample_idx - last_sample_idx > 1:
+                change_idx, change_frame = _bisect_change(
+                    cap, detector, threshold, last_sample_idx, sample_idx, frame
+                )
+                seeked = True
+            change_frames.append(change_idx)
+            detector.set_reference(change_frame)
+            last_sample_idx = change_idx
+            if change_idx == sample_idx:
+                break
+        last_sample_idx = sample_idx
+        return seeked
 
     # Process frames sequentially
     while True:
-        ret, frame = cap.read()
-        if not ret:
+        if (end_frame is not None and frame_idx + 1 >= end_frame) or not cap.grab():
+            if has_reference and frame_idx > last_sample_idx:
+                # The tail of the range lies between two samples
+                frame = _read_frame_at(cap, frame_idx)
+                if frame is not None:
+                    analyze(frame_idx, frame)
             break
         frame_idx += 1
 
-        if prev_frame is None:
-            # First frame - start first segment
-            segment_start = frame_idx
-            prev_frame = frame.copy()
+        if has_reference and frame_idx - last_sample_idx < sample_interval:
             continue
 
-        # Detect significant changes for EVERY frame
-        change_rate = detect_significant_changes(prev_frame, frame)
+        ret, frame = cap.retrieve()
+        if not ret:
+            break
 
-        if change_rate > threshold:
-            if frame_idx - segment_start >= min_frame_gap:
-                segments.append((segment_start, frame_idx))
-            # Start new segment
-            segment_start = frame_idx
-            prev_frame = frame.copy()
+        if not has_reference:
+            # First frame - start first segment
+            change_frames.append(frame_idx)
+            detector.set_reference(frame)
+            has_reference = True
+            last_sample_idx = frame_idx
+            continue
+
+        # Detect significant changes for every sampled frame
+        if analyze(frame_idx, frame):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx + 1)
 
         # Report progress
-        if frame_idx % 50 == 0 or frame_idx == frame_count - 1:
+        if (
+            frame_idx // 50 != (frame_idx - sample_interval) // 50
+            or frame_idx == frame_count - 1
+        ):
             if report_progress:
                 report_progress(frame_idx + 1, frame_count)
 
-    if segment_start is not None:
-        segments.append((segment_start, frame_idx + 1))
+    return change_frames, frame_idx + 1
+
 
+def _segments_from_change_frames(
+    change_frames: List[int], end_frame: int, min_frame_gap: int
+) -> List[Tuple[int, int]]:
+    segments = []  # Collect all segments in a list
+    if not change_frames:
+        return segments
+    segment_start = change_frames[0]
+    for change_idx in change_frames[1:]:
+        if change_idx - segment_start >= min_frame_gap:
+            segments.append((segment_start, change_idx))
+        # Start new segment
+        segment_start = change_idx
+    segments.append((segment_start, end_frame))
     return segments
+
+
+def find_all_significant_frame(
+    cap: cv2.VideoCapture,
+    threshold: float,
+    min_frame_gap: int,
+    report_progress: Optional[Callable[[int, int], None]] = None,
+    analysis_scale: float = ANALYSIS_SCALE,
+    sample_interval: int = 1,
+) -> List[Tuple[int, int]]:
+    """
+    Split the video into segments of frames without significant changes.
+
+    Args:
+        sample_interval: Analyze only every k-th frame, skipped frames are
+            grabbed without being converted to images. When a sample differs
+            from the reference, the exact change frame is found by bisecting
+            between the samples.
+    """
+    change_frames, end_frame = _find_change_frames(
+        cap,
+        threshold,
+        report_progress=report_progress,
+        analysis_scale=analysis_scale,
+        sample_interval=sample_interval,
+    )
+    return _segments_from_change_frames(change_frames, end_frame, min_frame_gap)
+
+
+def find_all_significant_frame_cached(
+    cap: cv2.VideoCapture,
+    threshold: float,
+    min_frame_gap: int,
+    cache: AnalysisCache,
+    report_progress: Optional[Callable[[int, int], None]] = None,
+) -> List[Tuple[int, int]]:
+    """
+    Same as `find_all_significant_frame` analyzing every frame, but the change
+    rates recorded in `cache` are replayed first. The video is only decoded
+    from the first frame they do not decide, and the rates found there are
+    recorded in `cache`.
+    """
+    change_frames, resume_frame = cache.replay(
+        threshold, threshold * PRE_THRESHOLD_RATIO
+    )
+    if resume_frame is None:
+        if report_progress:
+            report_progress(cache.end_frame, cache.end_frame)
+        return _segments_from_change_frames(
+            change_frames, cache.end_frame, min_frame_gap
+        )
+
+    rates: List[Tuple[int, float, float]] = []
+    new_change_frames, end_frame = _find_change_frames(
+        cap,
+        threshold,
+        resume_frame,
+        report_progress=report_progress,
+        analysis_scale=cache.analysis_scale,
+        on_change_rate=lambda *rate: rates.append(rate),
+    )
+    change_frames += new_change_frames
+    cache.record(change_frames, end_frame, rates)
+    return _segments_from_change_frames(change_frames, end_frame, min_frame_gap)
+
+
+def _find_change_frames_in_chunk(
+    video_input: str,
+    threshold: float,
+    start_frame: int,
+    end_frame: Optional[int],
+    analysis_scale: float,
+    sample_interval: int,
+) -> Tuple[List[int], int]:
+    cap = cv2.VideoCapture(video_input)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Cannot open video: {video_input}")
+        return _find_change_frames(
+            cap,
+            threshold,
+            start_frame,
+            end_frame,
+            analysis_scale=analysis_scale,
+            sample_interval=sample_interval,
+        )
+    finally:
+        cap.release()
+
+
+def _stitch_chunk(
+    cap: cv2.VideoCapture,
+    detector: ChangeDetector,
+    threshold: float,
+    reference: np.ndarray,
+    start_frame: int,
+    change_frames: List[int],
+    end_frame: int,
+) -> List[int]:
+    """
+    Change frames of a chunk analyzed on its own from `start_frame`, as an
+    analysis going on with the `reference` of the previous chunk finds them.
+
+    The chunk compared its frames against its first frame instead. Its changes
+    are checked against `reference` in order, together with the frame before
+    each of them, up to the first change both analyses agree on, from which on
+    their references agree. A change the chunk could not see is found by
+    bisecting, assuming like sampling that slides do not change back.
+    """
+    detector.set_reference(reference)
+    stitched: List[int] = []
+    # Last frame known not to differ from the reference
+    last_idx = start_frame - 1
+    for i, change_idx in enumerate(change_frames + [end_frame]):
+        # The frames before the change did not differ from the chunk's reference
+        while change_idx - 1 > last_idx:
+            frame = _read_frame_at(cap, change_idx - 1)
+            if frame is None or detector.change_rate(frame) <= threshold:
+                break
+            last_idx, frame = _bisect_change(
+                cap, detector, threshold, last_idx, change_idx - 1, frame
+            )
+            stitched.append(last_idx)
+            detector.set_reference(frame)
+        if i == len(change_frames):
+            break
+        frame = _read_frame_at(cap, change_idx)
+        if frame is None or detector.change_rate(frame) > threshold:
+            return stitched + change_frames[i:]
+        last_idx = change_idx
+    return stitched
+
+
+def find_all_significant_frame_parallel(
+    video_input: str,
+    threshold: float,
+    min_frame_gap: int,
+    processes: int,
+    report_progress: Optional[Callable[[int, int], None]] = None,
+    analysis_scale: float = ANALYSIS_SCALE,
+    sample_interval: int = 1,
+) -> List[Tuple[int, int]]:
+    """
+    Same as `find_all_significant_frame`, but the video is split into chunks
+    which are analyzed by up to `processes` worker processes, each with its
+    own capture.
+
+    Each chunk starts with its own reference frame. When stitching, its changes
+    are reconciled with the reference the previous chunk ended with by
+    reading a few frames, see `_stitch_chunk`.
+    """
+    cap = cv2.VideoCapture(video_input)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Cannot open video: {video_input}")
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        # More chunks than processes evens out the load and the progress
+        n_chunks = max(
+            1, min(processes * CHUNKS_PER_PROCESS, frame_count // MIN_CHUNK_FRAMES)
+        )
+        bounds = [frame_count * i // n_chunks for i in range(n_chunks + 1)]
+        # The frame count is an estimate, read the last chunk to the real end
+        chunks: List[Tuple[int, Optional[int]]] = [
+            (bounds[i], bounds[i + 1]) for i in range(n_chunks - 1)
+        ] + [(bounds[-2], None)]
+
+        results: List[Optional[Tuple[List[int], int]]] = [None] * n_chunks
+        n_frames_done = 0
+        with ProcessPoolExecutor(max_workers=min(processes, n_chunks)) as executor:
+            futures = {
+                executor.submit(
+                    _find_change_frames_in_chunk,
+                    video_input,
+                    threshold,
+                    start_frame,
+                    end_frame,
+                    analysis_scale,
+                    sample_interval,
+                ): i
+                for i, (start_frame, end_frame) in enumerate(chunks)
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i] = future.result()
+                n_frames_done += results[i][1] - chunks[i][0]
+                if report_progress:
+                    report_progress(min(n_frames_done, frame_count), frame_count)
+
+        change_frames: List[int] = []
+        end_frame = 0
+        detector = ChangeDetector(threshold * PRE_THRESHOLD_RATIO, analysis_scale)
+        for (start_frame, _), result in zip(chunks, results):
+            assert result is not None, "chunk has not been analyzed"
+            chunk_change_frames, chunk_end_frame = result
+            if not chunk_change_frames:
+                continue
+            reference = (
+                _read_frame_at(cap, change_frames[-1]) if change_frames else None
+            )
+            if reference is not None:
+                chunk_change_frames = _stitch_chunk(
+                    cap,
+                    detector,
+                    threshold,
+                    reference,
+                    start_frame,
+                    chunk_change_frames,
+                    chunk_end_frame,
+                )
+            change_frames.extend(chunk_change_frames)
+            end_frame = chunk_end_frame
+        return _segments_from_change_frames(change_frames, end_frame, min_frame_gap)
+    finally:
+        cap.release()
@@ -0,0 +1,218 @@
+import random
+from typing import Callable, List, Optional, Tuple
+import cv2
+import numpy as np
+
+from njupt_smartclass_downloader.slides_extractor.mode_frame import (
+    STABLE_CHANGE_FRACTION,
+    ModeFrameAccumulator,
+    composite_frames,
+)
+from njupt_smartclass_downloader.slides_extractor.significant_frame import (
+    ANALYSIS_SCALE,
+    PRE_THRESHOLD_RATIO,
+    ChangeDetector,
+)
+from njupt_smartclass_downloader.slides_extractor.slide_index import (
+    Slide,
+    SlideIndex,
+)
+from njupt_smartclass_downloader.slides_extractor.taskbar_detector import (
+    TaskbarDetector,
+)
+
+# Frames of a segment between two taskbar checks, besides its first and last
+TASKBAR_CHECK_INTERVAL = 125
+# Memory the sampled frames of a segment may take with `mode_samples`, fewer
+# samples are kept if that many full-resolution frames do not fit
+MAX_SAMPLE_BYTES = 256 * 1024 * 1024
+
+
+class _Segment:
+    def __init__(
+        self,
+        start_frame: int,
+        first_frame: np.ndarray,
+        max_samples: Optional[int],
+        stable_fraction: Optional[float],
+        taskbar_detector: TaskbarDetector,
+        rng: random.Random,
+        slide_index: SlideIndex,
+    ) -> None:
+        self.start_frame = start_frame
+        self.taskbar_detector = taskbar_detector
+        if max_samples is not None:
+            max_samples = max(
+                2, min(max_samples, MAX_SAMPLE_BYTES // first_frame.nbytes)
+            )
+        self.max_samples = max_samples
+        self.stable_fraction = stable_fraction
+        self.rng = rng
+        self.last_frame = first_frame
+        self.frame_count = 1
+        # All dropped as soon as the segment is known not to be fullscreen.
+        # A segment showing a slide seen before is not composited again
+        self.duplicate_of: Optional[Slide] = None
+        self.accumulator: Optional[ModeFrameAccumulator] = None
+        # With `max_samples`, a uniform sample of the frames so far instead
+        # (reservoir sampling), as the length of the segment is not known yet.
+        # Each frame is kept with its position, to be composited in order
+        self.samples: Optional[List[Tuple[int, np.ndarray]]] = None
+        if taskbar_detector.detect(first_frame):
+            return
+        self.duplicate_of = slide_index.find(first_frame)
+        if self.duplicate_of is None:
+            if max_samples is None:
+                self.accumulator = ModeFrameAccumulator(first_frame)
+            else:
+                self.samples = [(0, first_frame)]
+
+    @property
+    def is_fullscreen_candidate(self) -> bool:
+        return (
+            self.duplicate_of is not None
+            or self.accumulator is not None
+            or self.samples is not None
+        )
+
+    def add(self, frame: np.ndarray) -> None:
+        self.last_frame = frame
+        self.frame_count += 1
+        if not self.is_fullscreen_candidate:
+            return
+        if (
+            self.frame_count % TASKBAR_CHECK_INTERVAL == 0
+            and self.taskbar_detector.detect(frame)
+        ):
+            self.duplicate_of = None
+            self.accumulator = None
+            self.samples = None
+            return
+        if self.accumulator is not None:
+            self.accumulator.add(frame)
+        elif self.samples is not None and self.max_samples is not None:
+            sample = (self.frame_count - 1, frame)
+            if len(self.samples) < self.max_samples:
+                self.samples.append(sample)
+            else:
+                i = self.rng.randrange(self.frame_count)
+                if i < self.max_samples:
+                    self.samples[i] = sample
+
+    def is_fullscreen(self) -> bool:
+        if not self.is_fullscreen_candidate:
+            return False
+        return self.frame_count == 1 or not self.taskbar_detector.detect(
+            self.last_frame
+        )
+
+    def mode_frame(self) -> np.ndarray:
+        """The mode frame of a fullscreen segment which is no duplicate."""
+        if self.accumulator is not None:
+            return self.accumulator.result()
+        assert self.samples is not None
+        self.samples.sort(key=lambda sample: sample[0])
+        return composite_frames(
+            [frame for _, frame in self.samples], self.stable_fraction
+        )
+
+
+def find_fullscreen_slides(
+    cap: cv2.VideoCapture,
+    threshold: float,
+    min_frame_gap: int,
+    report_progress: Optional[Callable[[int, int], None]] = None,
+    analysis_scale: float = ANALYSIS_SCALE,
+    mode_samples: Optional[int] = None,
+    mode_stable_fraction: Optional[float] = STABLE_CHANGE_FRACTION,
+    deduplicate: bool = False,
+    on_slide: Optional[Callable[[Slide], None]] = None,
+) -> List[Slide]:
+    """
+    Find segments without significant changes, drop those showing a taskbar and
+    composite the mode frame of the rest, all in one sequential decode pass.
+
+    Unlike `filter_fullscreen_segments`, which checks the first, middle and
+    last frame of a finished segment, a segment is checked for a taskbar on
+    its first and last frame and every `TASKBAR_CHECK_INTERVAL` frames, so
+    that compositing a rejected segment stops early.
+
+    With `mode_samples`, a segment is composited from that many of its frames,
+    sampled uniformly across it while it is decoded, stopping once the mode
+    frame is stable (see `calculate_mode_frame`). These frames are held in
+    memory until the segment ends, fewer of them than `mode_samples` if they
+    would take more than MAX_SAMPLE_BYTES.
+
+    With `deduplicate`, a slide shown again is merged into its first
+    occurrence, see `SlideIndex`. The first frame of a segment is looked up,
+    a segment found to be a duplicate is not composited.
+
+    With `on_slide`, each slide is handed over as soon as it is composited
+    and its mode frame is released afterwards, instead of all mode frames
+    being held until the end.
+
+    Returns:
+        Fullscreen slides with their mode frames
+    """
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    detector = ChangeDetector(threshold * PRE_THRESHOLD_RATIO, analysis_scale)
+    taskbar_detector = TaskbarDetector()
+    segment: Optional[_Segment] = None
+    slide_index = SlideIndex(threshold, deduplicate, on_slide)
+    # Seeded, so that running again gives the same slides
+    rng = random.Random(0)
+    frame_idx = -1
+
+    def start_segment(start_frame: int, frame: np.ndarray) -> _Segment:
+        detector.set_reference(frame)
+        return _Segment(
+            start_frame,
+            frame,
+            mode_samples,
+            mode_stable_fraction,
+            taskbar_detector,
+            rng,
+            slide_index,
+        )
+
+    def finish_segment(end_frame: int, is_last: bool) -> None:
+        assert segment is not None
+        # The last segment is kept regardless of its length
+        if not is_last and end_frame - segment.start_frame < min_frame_gap:
+            return
+        if not segment.is_fullscreen():
+            return
+        if segment.duplicate_of is not None:
+            slide_index.merge(segment.duplicate_of, (segment.start_frame, end_frame))
+        else:
+            slide_index.add((segment.start_frame, end_frame), segment.mode_frame())
+
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame_idx += 1
+
+        if segment is None:
+            # First frame - start first segment
+            segment = start_segment(frame_idx, frame)
+            continue
+
+        if detector.change_rate(frame) > threshold:
+            finish_segment(frame_idx, is_last=False)
+            # Start new segment
+            segment = start_segment(frame_idx, frame)
+        else:
+            segment.add(frame)
+
+        # Report progress
+        if frame_idx % 50 == 0 or frame_idx == frame_count - 1:
+            if report_progress:
+                report_progress(frame_idx + 1, frame_count)
+
+    if segment is not None:
+        finish_segment(frame_idx + 1, is_last=True)
+
+    return slide_index.slides
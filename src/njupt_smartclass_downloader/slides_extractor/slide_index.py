@@ -0,0 +1,147 @@
+from dataclasses import dataclass, field
+import json
+import os
+from typing import Callable, List, Optional, Tuple
+import cv2
+import numpy as np
+
+from njupt_smartclass_downloader.slides_extractor.significant_frame import (
+    detect_significant_changes,
+)
+
+# Side of the difference hash, which has HASH_SIZE * HASH_SIZE bits
+HASH_SIZE = 16
+# Slides whose hashes differ in at most this many bits are compared pixel by
+# pixel, the hash alone cannot tell builds of a slide apart
+MAX_HASH_DISTANCE = 24
+# Fast lossless compression of the mode frames held for comparisons
+PNG_COMPRESSION = 1
+
+
+def perceptual_hash(frame: np.ndarray) -> int:
+    """
+    Difference hash of a frame: whether each pixel of a tiny grayscale
+    thumbnail is brighter than its right neighbour.
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    thumbnail = cv2.resize(
+        gray, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA
+    )
+    bits = (thumbnail[:, 1:] > thumbnail[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+@dataclass
+class Slide:
+    # Segments showing the slide, in [start_frame, end_frame) form
+    segments: List[Tuple[int, int]]
+    phash: int
+    mode_frame: Optional[np.ndarray] = field(default=None, repr=False)
+    # PNG of the mode frame kept to compare later segments with, see `SlideIndex`
+    encoded_frame: Optional[bytes] = field(default=None, repr=False)
+
+    def title(self, number: int) -> str:
+        frames = ", ".join(f"{start}-{end - 1}" for start, end in self.segments)
+        return f"Slide {number} (frames {frames})"
+
+    def frame(self) -> np.ndarray:
+        if self.mode_frame is not None:
+            return self.mode_frame
+        if self.encoded_frame is None:
+            raise ValueError("The mode frame has been released")
+        return cv2.imdecode(
+            np.frombuffer(self.encoded_frame, dtype=np.uint8), cv2.IMREAD_COLOR
+        )
+
+
+def _encode_frame(frame: np.ndarray) -> bytes:
+    ret, data = cv2.imencode(
+        ".png", frame, [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION]
+    )
+    if not ret:
+        raise ValueError("Cannot encode the mode frame")
+    return data.tobytes()
+
+
+class SlideIndex:
+    """
+    Slides in the order they are first shown, each handed to `on_slide` as
+    soon as it is added, after which its mode frame is released.
+
+    With `deduplicate`, a segment showing a slide again is merged into its
+    first occurrence. `find` looks up a representative frame of the segment,
+    e.g. its first one, so that a repeated slide need not be composited:
+    candidates are found by perceptual hash and confirmed if the change rate
+    between the frame and their mode frame stays within `threshold`, like the
+    frames of a segment. The first mode frame is kept, a later one within the
+    threshold shows the same slide as far as the analysis can tell. Mode
+    frames are held PNG-encoded for these comparisons.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        deduplicate: bool = False,
+        on_slide: Optional[Callable[[Slide], None]] = None,
+        max_distance: int = MAX_HASH_DISTANCE,
+    ) -> None:
+        self.threshold = threshold
+        self.deduplicate = deduplicate
+        self.on_slide = on_slide
+        self.max_distance = max_distance
+        self.slides: List[Slide] = []
+
+    def find(self, frame: np.ndarray) -> Optional[Slide]:
+        """The slide showing the same picture as `frame`, if deduplicating."""
+        if not self.deduplicate:
+            return None
+        phash = perceptual_hash(frame)
+        candidates = sorted(
+            ((slide.phash ^ phash).bit_count(), i)
+            for i, slide in enumerate(self.slides)
+        )
+        for distance, i in candidates:
+            if distance > self.max_distance:
+                break
+            slide = self.slides[i]
+            if detect_significant_changes(slide.frame(), frame) <= self.threshold:
+                return slide
+        return None
+
+    def merge(self, slide: Slide, segment: Tuple[int, int]) -> None:
+        """Add a segment found to show `slide` again."""
+        slide.segments.append(segment)
+
+    def add(self, segment: Tuple[int, int], mode_frame: np.ndarray) -> Slide:
+        """Returns the slide the segment was added as, or merged into."""
+        slide = self.find(mode_frame)
+        if slide is not None:
+            self.merge(slide, segment)
+            return slide
+        slide = Slide([segment], perceptual_hash(mode_frame), mode_frame)
+        if self.deduplicate:
+            slide.encoded_frame = _encode_frame(mode_frame)
+        self.slides.append(slide)
+        if self.on_slide:
+            self.on_slide(slide)
+            slide.mode_frame = None
+        return slide
+
+
+def save_hash_index(slides: List[Slide], path: str) -> None:
+    """Write the hashes and segments of slides as JSON, e.g. next to the PDF."""
+    data = {
+        "hash_size": HASH_SIZE,
+        "slides": [
+            {
+                "title": slide.title(i + 1),
+                "hash": f"{slide.phash:0{HASH_SIZE * HASH_SIZE // 4}x}",
+                "segments": [list(segment) for segment in slide.segments],
+            }
+            for i, slide in enumerate(slides)
+        ],
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
@@ -1,4 +1,6 @@
-from typing import List, Tuple
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import zlib
 import cv2
 import numpy as np
 
@@ -9,6 +11,13 @@ def detect_windows_logo(left_region: np.ndarray) -> bool:
         return False
 
     gray = cv2.cvtColor(left_region, cv2.COLOR_BGR2GRAY)
+    return _detect_windows_logo_gray(gray)
+
+
+def _detect_windows_logo_gray(gray: np.ndarray) -> bool:
+    if gray.shape[0] < 20 or gray.shape[1] < 40:
+        return False
+
     edges = cv2.Canny(gray, 30, 100)
     contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
@@ -20,15 +29,20 @@ def detect_windows_logo(left_region: np.ndarray) -> bool:
             if 0.8 < aspect_ratio < 1.5:
                 center_x = x + w // 2
                 center_y = y + h // 2
-                if (
-                    center_x < left_region.shape[1] // 2
-                    and center_y > left_region.shape[0] // 4
-                ):
+                if center_x < gray.shape[1] // 2 and center_y > gray.shape[0] // 4:
                     return True
 
     return False
 
 
+def _count_colors(region: np.ndarray) -> int:
+    # Pack BGR into one integer per pixel, sorting integers is far cheaper
+    # than sorting rows
+    pixels = region.reshape(-1, 3).astype(np.uint32)
+    packed = pixels[:, 0] | (pixels[:, 1] << 8) | (pixels[:, 2] << 16)
+    return len(np.unique(packed))
+
+
 def detect_taskbar(frame: np.ndarray) -> bool:
     """Check if frame has Windows taskbar."""
     height, width = frame.shape[:2]
@@ -38,7 +52,6 @@ def detect_taskbar(frame: np.ndarray) -> bool:
     gray_taskbar = cv2.cvtColor(taskbar_region, cv2.COLOR_BGR2GRAY)
 
     left_portion_width = min(200, width // 4)
-    left_region = taskbar_region[:, :left_portion_width]
 
     # Quick histogram check
     hist = cv2.calcHist([gray_taskbar], [0], None, [256], [0, 256])
@@ -49,49 +62,88 @@ def detect_taskbar(frame: np.ndarray) -> bool:
     if not (0.3 < dark_ratio < 0.8):
         return False
 
-    # Detailed checks
-    left_gray = cv2.cvtColor(left_region, cv2.COLOR_BGR2GRAY)
+    # Detailed checks, cheapest first, until the outcome is decided
+    left_gray = gray_taskbar[:, :left_portion_width]
     edges = cv2.Canny(left_gray, 50, 150)
-    edge_density = np.sum(edges > 0) / (edges.shape[0] * edges.shape[1])
+    edge_density = np.count_nonzero(edges) / (edges.shape[0] * edges.shape[1])
 
     horizontal_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (15, 1))
     horizontal_lines = cv2.morphologyEx(edges, cv2.MORPH_OPEN, horizontal_kernel)
-    horizontal_line_density = np.sum(horizontal_lines > 0) / (
+    horizontal_line_density = np.count_nonzero(horizontal_lines) / (
         horizontal_lines.shape[0] * horizontal_lines.shape[1]
     )
 
-    unique_colors = len(
-        np.unique(taskbar_region.reshape(-1, taskbar_region.shape[-1]), axis=0)
-    )
-    color_diversity = unique_colors / (taskbar_height * width)
-
     taskbar_indicators = 1
 
     if 0.01 < edge_density < 0.1:
         taskbar_indicators += 1
     if horizontal_line_density > 0.001:
         taskbar_indicators += 1
+    if taskbar_indicators >= 3:
+        return True
+
+    color_diversity = _count_colors(taskbar_region) / (taskbar_height * width)
     if color_diversity < 0.5:
         taskbar_indicators += 1
+    if taskbar_indicators >= 3:
+        return True
+
+    # The logo alone is worth enough indicators to decide
+    return _detect_windows_logo_gray(left_gray)
+
+
+class TaskbarDetector:
+    """
+    `detect_taskbar` with results cached by the content of the taskbar region.
+
+    Static screens usually decode to identical pixels, so the frames checked
+    within a segment mostly hit the cache.
+    """
 
-    logo_detected = detect_windows_logo(left_region)
-    if logo_detected:
-        taskbar_indicators += 2
+    def __init__(self, cache_size: int = 64) -> None:
+        self.cache_size = cache_size
+        self.__cache: OrderedDict[int, bool] = OrderedDict()
 
-    return taskbar_indicators >= 3
+    def detect(self, frame: np.ndarray) -> bool:
+        height = frame.shape[0]
+        taskbar_region = frame[height - int(height * 0.08) :]
+        key = zlib.crc32(np.ascontiguousarray(taskbar_region).data)
+        if key in self.__cache:
+            self.__cache.move_to_end(key)
+            return self.__cache[key]
+        result = detect_taskbar(frame)
+        self.__cache[key] = result
+        if len(self.__cache) > self.cache_size:
+            self.__cache.popitem(last=False)
+        return result
 
 
 def filter_fullscreen_segments(
-    cap: cv2.VideoCapture, all_segments: List[Tuple[int, int]]
+    cap: cv2.VideoCapture,
+    all_segments: List[Tuple[int, int]],
+    verdicts: Optional[Dict[Tuple[int, int], bool]] = None,
 ) -> List[Tuple[int, int]]:
+    """
+    Args:
+        verdicts: Whether segments are fullscreen, as found earlier. Segments
+            found in it are not checked again, those checked are added to it.
+    """
     fullscreen_segments = []
+    detector = TaskbarDetector()
 
     for i, (start_frame, end_frame) in enumerate(all_segments):
+        if verdicts is not None and (start_frame, end_frame) in verdicts:
+            if verdicts[(start_frame, end_frame)]:
+                fullscreen_segments.append((start_frame, end_frame))
+            continue
         accept_segment = True
-        frame_to_check = (
-            start_frame,
-            start_frame + (end_frame - start_frame) // 2,
-            end_frame - 1,
+        # Short segments would check the same frame more than once
+        frame_to_check = dict.fromkeys(
+            (
+                start_frame,
+                start_frame + (end_frame - start_frame) // 2,
+                end_frame - 1,
+            )
         )
 
         for frame_idx in frame_to_check:
@@ -101,10 +153,12 @@ def filter_fullscreen_segments(
                 accept_segment = False
                 break
 
-            if detect_taskbar(frame):
+            if detector.detect(frame):
                 accept_segment = False
                 break
 
+        if verdicts is not None:
+            verdicts[(start_frame, end_frame)] = accept_segment
         if accept_segment:
             fullscreen_segments.append((start_frame, end_frame))
     return fullscreen_segments
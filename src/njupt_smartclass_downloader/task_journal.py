@@ -0,0 +1,103 @@
+from dataclasses import dataclass
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class JournalEntry:
+    id: int
+    kind: str
+    params: Dict[str, Any]
+    status: str
+    bytes_done: Optional[int] = None
+    bytes_total: Optional[int] = None
+
+
+class TaskJournal:
+    """
+    SQLite journal of submitted tasks, their status and transfer progress, so
+    that unfinished work can be re-enqueued after the application restarts.
+    """
+
+    UNFINISHED_STATUSES = ("queued", "running", "paused")
+
+    def __init__(self, path: str) -> None:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.__mutex = threading.Lock()
+        self.__conn = sqlite3.connect(path, check_same_thread=False)
+        with self.__mutex, self.__conn:
+            # WAL without fsync per commit: progress updates are frequent and
+            # losing the last few of them only costs a re-check on resume
+            self.__conn.execute("PRAGMA journal_mode=WAL")
+            self.__conn.execute("PRAGMA synchronous=NORMAL")
+            self.__conn.execute("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    bytes_done INTEGER,
+                    bytes_total INTEGER,
+                    updated_at REAL NOT NULL
+                )
+                """)
+            # Finished work is of no use to the next session. Failed tasks are
+            # not retried automatically either, the user submits them again
+            self.__conn.execute(
+                "DELETE FROM tasks WHERE status IN ('completed', 'cancelled', 'failed')"
+            )
+
+    def add(self, kind: str, params: Dict[str, Any], status: str) -> int:
+        with self.__mutex, self.__conn:
+            cursor = self.__conn.execute(
+                "INSERT INTO tasks (kind, params, status, updated_at)"
+                " VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(params), status, time.time()),
+            )
+            assert cursor.lastrowid is not None
+            return cursor.lastrowid
+
+    def update_status(self, id: int, status: str, error: Optional[str] = None) -> None:
+        with self.__mutex, self.__conn:
+            self.__conn.execute(
+                "UPDATE tasks SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, time.time(), id),
+            )
+
+    def update_transfer(self, id: int, bytes_done: int, bytes_total: int) -> None:
+        with self.__mutex, self.__conn:
+            self.__conn.execute(
+                "UPDATE tasks SET bytes_done = ?, bytes_total = ?, updated_at = ?"
+                " WHERE id = ?",
+                (bytes_done, bytes_total, time.time(), id),
+            )
+
+    def unfinished(self) -> List[JournalEntry]:
+        with self.__mutex:
+            rows = self.__conn.execute(
+                "SELECT id, kind, params, status, bytes_done, bytes_total"
+                " FROM tasks WHERE status IN (?, ?, ?) ORDER BY id",
+                self.UNFINISHED_STATUSES,
+            ).fetchall()
+        return [
+            JournalEntry(
+                id=row[0],
+                kind=row[1],
+                params=json.loads(row[2]),
+                status=row[3],
+                bytes_done=row[4],
+                bytes_total=row[5],
+            )
+            for row in rows
+        ]
+
+    def close(self) -> None:
+        with self.__mutex:
+            self.__conn.close()
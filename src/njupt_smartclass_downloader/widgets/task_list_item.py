@@ -15,12 +15,15 @@ def format_duration(duration: float) -> str:
 
 class TaskListItem(ListItem):
     def __init__(self, task_info):
+        self.task_info = task_info
         content = self._create_content(task_info)
         super().__init__(Static(content))
 
     def _create_content(self, task_info: TaskInfo) -> Text:
         content = Text()
         content.append(f"{task_info.display_name}", style="bold white")
+        if task_info.priority:
+            content.append(f" [priority {task_info.priority:+d}]", style="bold cyan")
 
         if task_info.status == TaskStatus.QUEUED:
             status_display = "Queued"
@@ -36,6 +39,10 @@ class TaskListItem(ListItem):
                     format_duration(task_info.elapsed_time)
         elif task_info.status == TaskStatus.FAILED:
             status_display = "Failed"
+        elif task_info.status == TaskStatus.PAUSED:
+            status_display = "Paused"
+        elif task_info.status == TaskStatus.CANCELLED:
+            status_display = "Cancelled"
         else:
             status_display = "Unknown"
         content.append(
@@ -60,6 +67,7 @@ class TaskListItem(ListItem):
         return content
 
     def update_task_info(self, task_info):
+        self.task_info = task_info
         content = self._create_content(task_info)
         static_widget = self.query_one(Static)
         static_widget.update(content)